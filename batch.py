@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+'''
+Solve many warehouses in parallel, one process per core.
+
+Each warehouse file is solved in a worker process of a ProcessPoolExecutor,
+with an optional time limit and memory cap per puzzle. The results are
+yielded (and printed by the command line) as soon as each puzzle finishes,
+and a JSON summary can be written at the end.
+
+	python3 batch.py warehouses/ --jobs 4 --timeout 60 --summary summary.json
+'''
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+try:
+	import resource
+except ImportError: #not on Windows
+	resource = None
+
+import search
+import sokoban
+from puzzler import SokobanPuzzle, SokobanMacroPuzzle, SokobanPullPuzzle
+
+#search methods of solve_file
+METHODS = ('bfs', 'moves', 'pushes', 'bidirectional', 'ida')
+
+#suffixes of the multi-level collection files, see warehouse_jobs
+COLLECTIONS = ('.sok', '.xsb')
+
+#seconds after the timeout of solve_file before SIGALRM interrupts a puzzle
+#that did not stop on its own (the searches stop at the timeout, see
+#search.LimitReached, but building the puzzle is not timed)
+ALARM_GRACE = 5
+
+class PuzzleTimeout(Exception):
+	pass
+
+def _alarm(signum, frame):
+	raise PuzzleTimeout()
+
+def warehouse_files(paths):
+	'''
+	Expand a list of directories, files and glob patterns into a sorted
+	list of warehouse files, without duplicates.
+	'''
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files += [os.path.join(path, name) for name in os.listdir(path)]
+		else:
+			files += glob.glob(path)
+	return sorted(set(f for f in files if os.path.isfile(f)))
+
+def warehouse_jobs(paths, use_mmap=True):
+	'''
+	The jobs of solve_batch for the files of warehouse_files(paths): the
+	path of each warehouse file, and a (name, rows) pair for each level of
+	the .sok/.xsb collection files, named path#n (n from 1). Collections are
+	read lazily, from a memory map if use_mmap is True.
+	'''
+	for path in warehouse_files(paths):
+		if path.lower().endswith(COLLECTIONS):
+			levels = sokoban.split_levels(sokoban.read_lines(path, use_mmap))
+			for n, (title, rows) in enumerate(levels, 1):
+				yield '{0}#{1}'.format(path, n), rows
+		else:
+			yield path
+
+def solve_file(path, method='pushes', heuristic='matching', timeout=None, memory_limit=None,
+memory_budget=None, checkpoint_dir=None, lines=None, cancel=None):
+	'''
+	Load and solve one warehouse file. Runs in a worker process.
+
+	@param lines: the board rows of the warehouse, if it is not read from
+	       the file (path then only names it, see warehouse_jobs)
+
+	@param method: 'bfs' (breadth first, fewest moves), 'moves' (A*, fewest
+	       moves), 'pushes' (A* over box pushes, fewest pushes),
+	       'bidirectional' (box pushes and pulls, fewest pushes) or 'ida'
+	       (IDA* over box pushes, fewest pushes, bounded memory)
+
+	@param timeout: seconds before giving up, or None. The search is
+	       given the time left as its time_limit, so it stops with its
+	       statistics (and saves its checkpoint); SIGALRM interrupts the
+	       puzzle ALARM_GRACE seconds later if it is still running
+
+	@param memory_limit: cap on the address space of the process in
+	       bytes, or None
+
+	@param memory_budget: bytes of explored states kept in memory by the
+	       'bfs', 'moves' and 'pushes' searches before spilling to disk,
+	       or None
+
+	@param checkpoint_dir: directory where the searches other than
+	       'bidirectional' save checkpoints, and resume from them, or None
+
+	@param cancel: an event (with an is_set method) stopping the search
+	       once set, or None
+
+	@return
+	    a dict with the file, the status ('solved', 'impossible', 'timeout',
+	    'cancelled', 'memory' or 'error'), the solution in LURD notation (lower case
+	    for moves, upper case for pushes)
+	    and its number of moves and pushes, the search.SearchStats of the
+	    search (nodes expanded, states generated, duplicates, largest
+	    frontier, nodes per second, peak memory and spills), and the wall
+	    time in seconds
+	'''
+	result = dict(file=path, method=method, status=None, moves=None, pushes=None,
+		nodes=None, states=None, seconds=None, solution=None)
+	start = time.time()
+
+	if memory_limit and resource is not None:
+		soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+		resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+	if timeout and hasattr(signal, 'setitimer'):
+		signal.signal(signal.SIGALRM, _alarm)
+		signal.setitimer(signal.ITIMER_REAL, timeout + ALARM_GRACE)
+
+	def remaining():
+		#the time_limit of the search: what is left of the timeout
+		return None if not timeout else max(0.0, timeout - (time.time() - start))
+
+	problem = None
+	stats = search.SearchStats() #filled in even if the search returns no node
+	options = dict(cancel=cancel, stats=stats) #of the searches
+	if checkpoint_dir:
+		#the full path and the rows tell apart levels of the same file name
+		digest = hashlib.sha1(os.path.abspath(path).encode())
+		if lines is not None:
+			digest.update('\n'.join(lines).encode())
+		options.update(resume=True, checkpoint=os.path.join(checkpoint_dir,
+			'{0}.{1}.{2}.ckpt'.format(os.path.basename(path), digest.hexdigest()[:12], method)))
+	try:
+		warehouse = sokoban.Warehouse()
+		if lines is None:
+			warehouse.read_warehouse_file(path)
+		else:
+			warehouse.extract_locations(lines)
+		if method == 'bfs':
+			problem = SokobanPuzzle(warehouse)
+			goal = search.breadth_first_graph_search(problem, memory_budget=memory_budget,
+				time_limit=remaining(), **options)
+		elif method == 'moves':
+			problem = SokobanPuzzle(warehouse, heuristic=heuristic)
+			goal = search.astar_graph_search(problem, memory_budget=memory_budget,
+				time_limit=remaining(), **options)
+		elif method == 'pushes':
+			problem = SokobanMacroPuzzle(warehouse, heuristic=heuristic)
+			goal = search.astar_graph_search(problem, memory_budget=memory_budget,
+				time_limit=remaining(), **options)
+		elif method == 'bidirectional':
+			problem = SokobanMacroPuzzle(warehouse)
+			goal = search.bidirectional_breadth_first_search(problem, SokobanPullPuzzle(warehouse),
+				time_limit=remaining(), cancel=cancel, stats=stats)
+		elif method == 'ida':
+			problem = SokobanMacroPuzzle(warehouse, heuristic=heuristic)
+			goal = search.iterative_deepening_astar_search(problem, time_limit=remaining(), **options)
+		else:
+			raise ValueError('unknown method {0!r}, expected one of {1}'.format(method, METHODS))
+
+		if isinstance(goal, search.LimitReached):
+			result['status'] = 'cancelled' if goal.reason == 'cancelled' else 'timeout'
+		elif goal is None:
+			result['status'] = 'impossible'
+		else:
+			path = problem.goal_path(goal)
+			pushed = [node.state.boxes != node.parent.state.boxes for node in path]
+			result['status'] = 'solved'
+			result['solution'] = ''.join(node.action[0] if push else node.action[0].lower()
+				for node, push in zip(path, pushed))
+			result['moves'] = len(path)
+			result['pushes'] = sum(pushed)
+	except PuzzleTimeout:
+		result['status'] = 'timeout'
+	except MemoryError:
+		result['status'] = 'memory'
+	except Exception as error:
+		result['status'] = 'error'
+		result['error'] = '{0}: {1}'.format(type(error).__name__, error)
+	finally:
+		if timeout and hasattr(signal, 'setitimer'):
+			signal.setitimer(signal.ITIMER_REAL, 0)
+		if memory_limit and resource is not None:
+			resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+	if problem is not None:
+		result.update(nodes=stats.expanded, states=stats.generated, duplicates=stats.duplicates,
+			max_frontier=stats.max_frontier, nodes_per_second=round(stats.nodes_per_second),
+			peak_memory=stats.peak_memory, spills=stats.spills)
+	result['seconds'] = round(time.time() - start, 3)
+	return result
+
+def solve_batch(files, jobs=None, **options):
+	'''
+	Solve the warehouse files over a pool of 'jobs' processes (default:
+	one per core), yielding the result dict of solve_file for each file
+	as soon as it is done. The options are passed to solve_file.
+	files may also hold the (name, rows) levels of warehouse_jobs. It is
+	consumed lazily: a few puzzles per process are submitted ahead.
+	'''
+	ahead = 4 * (jobs or os.cpu_count() or 1)
+	with ProcessPoolExecutor(max_workers=jobs) as pool:
+		pending = set()
+		for job in files:
+			if isinstance(job, str):
+				pending.add(pool.submit(solve_file, job, **options))
+			else:
+				name, rows = job
+				pending.add(pool.submit(solve_file, name, lines=rows, **options))
+			if len(pending) >= ahead:
+				done, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in done:
+					yield future.result()
+		for future in as_completed(pending):
+			yield future.result()
+
+def summarize(results):
+	'''
+	The summary written by the command line: counts per status, total
+	wall time, and the results sorted by file.
+	'''
+	results = sorted(results, key=lambda r: r['file'])
+	statuses = {}
+	for r in results:
+		statuses[r['status']] = statuses.get(r['status'], 0) + 1
+	return dict(puzzles=len(results), statuses=statuses,
+		seconds=round(sum(r['seconds'] for r in results), 3), results=results)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+	parser.add_argument('paths', nargs='+', help='warehouse files, .sok/.xsb collections, directories or glob patterns')
+	parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('-m', '--method', choices=METHODS, default='pushes')
+	parser.add_argument('--heuristic', default='matching')
+	parser.add_argument('-t', '--timeout', type=float, default=None, help='seconds per puzzle')
+	parser.add_argument('--memory', type=int, default=None, help='memory cap per puzzle, in MB')
+	parser.add_argument('--spill', type=int, default=None, help='MB of explored states kept in memory before spilling to disk')
+	parser.add_argument('--checkpoint-dir', default=None, help='save searches here, and resume from them')
+	parser.add_argument('-s', '--summary', default=None, help='write a JSON summary to this file')
+	args = parser.parse_args(argv)
+
+	files = warehouse_jobs(args.paths)
+	memory_limit = args.memory * 1024 * 1024 if args.memory else None
+	memory_budget = args.spill * 1024 * 1024 if args.spill else None
+	results = []
+
+	for result in solve_batch(files, args.jobs, method=args.method, heuristic=args.heuristic,
+	timeout=args.timeout, memory_limit=memory_limit, memory_budget=memory_budget,
+	checkpoint_dir=args.checkpoint_dir):
+		results.append(result)
+		print(json.dumps(result), flush=True)
+
+	summary = summarize(results)
+	if args.summary:
+		with open(args.summary, 'w') as f:
+			json.dump(summary, f, indent=1)
+	print(json.dumps(summary['statuses']), file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
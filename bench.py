@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+'''
+Benchmark the solvers and the warehouse functions over warehouse files.
+
+Each benchmark of each warehouse runs in a fresh worker process, so its
+peak resident memory is its own. The searches run through
+batch.solve_file (nodes expanded and states generated are counted by
+the search.SearchStats of the search), the quick functions are repeated until they
+take at least MIN_TIME seconds and their time per call is recorded.
+The results are written to a JSON file, which a later run can be
+compared with to flag slowdowns.
+
+	python3 bench.py warehouses/ --out baseline.json
+	python3 bench.py warehouses/ --out current.json --compare baseline.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import signal
+import sys
+import time
+from multiprocessing import Pool
+
+import batch
+import puzzler
+import search
+import sokoban
+
+#the quick functions are repeated for at least MIN_TIME seconds
+MIN_TIME = 0.2
+
+#searches of batch.solve_file: 'bfs' is the search of solve_sokoban_elem
+SEARCHES = batch.METHODS
+BENCHMARKS = SEARCHES + ('layered', 'taboo_cells', 'can_go_there', 'check_action_seq')
+
+def _repeat(function, *args):
+	#time per call of function(*args), repeated for at least MIN_TIME
+	calls, start = 0, time.perf_counter()
+	while True:
+		value = function(*args)
+		calls += 1
+		elapsed = time.perf_counter() - start
+		if elapsed >= MIN_TIME:
+			return elapsed / calls, value
+
+def run_benchmark(path, name, timeout=None):
+	'''
+	Run the benchmark 'name' (one of BENCHMARKS) on a warehouse file.
+	Runs in a worker process.
+
+	@return
+	    a dict with the file, the benchmark, its status ('solved',
+	    'impossible', 'ok', 'timeout', 'memory', 'error' or 'skipped'), the
+	    wall time in seconds (per call for the quick functions), the nodes
+	    expanded, states generated, duplicates, largest frontier and nodes
+	    per second of the searches, the solution length in moves, and the
+	    peak resident memory of the process in bytes
+	'''
+	os.environ.pop('SOKOBAN_CACHE_DIR', None) #time the solvers, not the cache
+	result = dict(file=path, benchmark=name, status=None, seconds=None, nodes=None,
+		states=None, duplicates=None, max_frontier=None, nodes_per_second=None,
+		length=None, peak_rss=None)
+
+	if name in SEARCHES:
+		solved = batch.solve_file(path, name, timeout=timeout)
+		result.update((key, solved.get(key)) for key in ('status', 'seconds', 'nodes', 'states',
+			'duplicates', 'max_frontier', 'nodes_per_second', 'error'))
+		result['length'] = solved['moves']
+	else:
+		if timeout and hasattr(signal, 'setitimer'):
+			signal.signal(signal.SIGALRM, batch._alarm)
+			signal.setitimer(signal.ITIMER_REAL, timeout)
+		try:
+			warehouse = sokoban.Warehouse()
+			warehouse.read_warehouse_file(path)
+			result['status'] = 'ok'
+			if name == 'layered':
+				start = time.perf_counter()
+				actions = puzzler.solve_sokoban_elem(warehouse, layered=True)
+				result['seconds'] = time.perf_counter() - start
+				result['status'] = 'impossible' if actions == ['Impossible'] else 'solved'
+				result['length'] = None if actions == ['Impossible'] else len(actions)
+			elif name == 'taboo_cells':
+				result['seconds'], _ = _repeat(puzzler.taboo_cells, warehouse)
+			elif name == 'can_go_there':
+				board = warehouse.compile()
+				cells = [(row, col) for row in range(1, board.height+1) for col in range(1, board.width+1)]
+				def query_all(warehouse):
+					return sum(puzzler.can_go_there(warehouse, cell) for cell in cells)
+				result['seconds'], result['length'] = _repeat(query_all, warehouse)
+			elif name == 'check_action_seq':
+				solution = batch.solve_file(path, 'pushes')['solution']
+				if solution is None:
+					result['status'] = 'skipped'
+				else:
+					actions = [sokoban.ACTIONS['UDLR'.index(move.upper())] for move in solution]
+					result['seconds'], _ = _repeat(puzzler.check_action_seq, warehouse, actions)
+					result['length'] = len(actions)
+			else:
+				raise ValueError('unknown benchmark {0!r}, expected one of {1}'.format(name, BENCHMARKS))
+		except batch.PuzzleTimeout:
+			result['status'] = 'timeout'
+		except MemoryError:
+			result['status'] = 'memory'
+		except ImportError as error: #no NumPy for 'layered'
+			result['status'] = 'skipped'
+			result['error'] = str(error)
+		except Exception as error:
+			result['status'] = 'error'
+			result['error'] = '{0}: {1}'.format(type(error).__name__, error)
+		finally:
+			if timeout and hasattr(signal, 'setitimer'):
+				signal.setitimer(signal.ITIMER_REAL, 0)
+
+	if result['seconds'] is not None:
+		result['seconds'] = round(result['seconds'], 6)
+	result['peak_rss'] = search.peak_memory()
+	return result
+
+def _run(task):
+	return run_benchmark(*task)
+
+def run_benchmarks(files, names=BENCHMARKS, jobs=1, timeout=None):
+	'''
+	Run the benchmarks 'names' on the warehouse files over 'jobs' worker
+	processes, each used for a single benchmark, yielding the result dict
+	of run_benchmark as soon as each one is done.
+	'''
+	tasks = [(path, name, timeout) for path in files for name in names]
+	pool = Pool(jobs, maxtasksperchild=1)
+	try:
+		for result in pool.imap_unordered(_run, tasks):
+			yield result
+	finally:
+		pool.terminate()
+
+def key(result):
+	return '{0}::{1}'.format(result['file'], result['benchmark'])
+
+def compare(baseline, current, threshold=0.2, min_seconds=0.01):
+	'''
+	Compare two benchmark runs (as written by main). Return the list of
+	(key, what, baseline value, current value) for each benchmark that got
+	more than 'threshold' (a fraction) slower, ignoring times below
+	min_seconds in both runs, that solved the puzzle in the baseline but
+	no longer does, or that finds a longer solution.
+	'''
+	flagged = []
+	for k, new in sorted(current['results'].items()):
+		old = baseline['results'].get(k)
+		if old is None:
+			continue
+		if old['status'] in ('solved', 'ok') and new['status'] != old['status']:
+			flagged.append((k, 'status', old['status'], new['status']))
+			continue
+		if old['seconds'] is not None and new['seconds'] is not None and \
+		max(old['seconds'], new['seconds']) >= min_seconds and \
+		new['seconds'] > old['seconds'] * (1 + threshold):
+			flagged.append((k, 'seconds', old['seconds'], new['seconds']))
+		if old['length'] is not None and new['length'] is not None and \
+		old['benchmark'] != 'can_go_there' and new['length'] > old['length']:
+			flagged.append((k, 'length', old['length'], new['length']))
+	return flagged
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+	parser.add_argument('paths', nargs='*', default=['warehouses'], help='warehouse files, directories or glob patterns')
+	parser.add_argument('-b', '--bench', default=','.join(BENCHMARKS), help='comma separated benchmarks, of: ' + ', '.join(BENCHMARKS))
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes (default: 1, for steadier timings)')
+	parser.add_argument('-t', '--timeout', type=float, default=60, help='seconds per benchmark')
+	parser.add_argument('-o', '--out', default=None, help='write the results to this JSON file')
+	parser.add_argument('-c', '--compare', default=None, help='baseline JSON file to compare the results with')
+	parser.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged by --compare, as a fraction (default: 0.2)')
+	args = parser.parse_args(argv)
+
+	names = [name for name in args.bench.split(',') if name]
+	for name in names:
+		if name not in BENCHMARKS:
+			parser.error('unknown benchmark {0!r}'.format(name))
+	run = dict(python=platform.python_version(), platform=platform.platform(),
+		date=time.strftime('%Y-%m-%d %H:%M:%S'), timeout=args.timeout, results={})
+	for result in run_benchmarks(batch.warehouse_files(args.paths), names, args.jobs, args.timeout):
+		run['results'][key(result)] = result
+		print(json.dumps(result), flush=True)
+
+	if args.out:
+		with open(args.out, 'w') as f:
+			json.dump(run, f, indent=1, sort_keys=True)
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		flagged = compare(baseline, run, args.threshold)
+		for k, what, old, new in flagged:
+			print('{0}: {1} {2} -> {3}'.format(k, what, old, new), file=sys.stderr)
+		print('{0} regressions'.format(len(flagged)), file=sys.stderr)
+		return 1 if flagged else 0
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
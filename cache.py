@@ -0,0 +1,197 @@
+'''
+A persistent cache of Sokoban solutions, in front of the solve_sokoban_*
+functions of puzzler.
+
+Solutions are kept in a SQLite database in a cache directory, under a
+fingerprint of the warehouse (walls, targets, boxes and worker) and of the
+solver and its options. The warehouse is translated so that it starts at
+(0,0), and optionally turned into the least of its 8 rotations and
+reflections, so the same level found elsewhere on the board, or mirrored,
+shares its entry. Solutions are stored in that canonical frame and their
+actions turned back on the way out. The least recently used entries are
+evicted beyond max_entries.
+
+The cache is off unless set_cache is called, or the SOKOBAN_CACHE_DIR
+environment variable names a cache directory.
+'''
+
+import functools
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+
+import sokoban
+
+#(a,b,c,d) turns (x,y) into (a*x+b*y, c*x+d*y): the identity, then the
+#other rotations and reflections of the board
+TRANSFORMS = ((1,0,0,1), (-1,0,0,1), (1,0,0,-1), (-1,0,0,-1),
+	(0,1,1,0), (0,-1,1,0), (0,1,-1,0), (0,-1,-1,0))
+
+def _apply(transform, points):
+	a, b, c, d = transform
+	return [(a*x + b*y, c*x + d*y) for (x,y) in points]
+
+def _render(warehouse, transform):
+	#the warehouse in the usual text format, after transform and translation
+	walls = _apply(transform, warehouse.walls)
+	X, Y = zip(*walls)
+	dx, dy = -min(X), -min(Y)
+	grid = [[' '] * (max(X) + dx + 1) for _ in range(max(Y) + dy + 1)]
+	def put(points, mark, over = None):
+		for (x,y) in _apply(transform, points):
+			cell = grid[y+dy][x+dx]
+			grid[y+dy][x+dx] = over if cell == '.' and over else mark
+	put(warehouse.walls, '#')
+	put(warehouse.targets, '.')
+	put(warehouse.boxes, '$', '*')
+	put([warehouse.worker], '@', '+')
+	return '\n'.join(''.join(row).rstrip() for row in grid)
+
+def canonical(warehouse, symmetries = True):
+	'''
+	Return the canonical text of the warehouse, and the transform (one of
+	TRANSFORMS) taking the warehouse to it. The text is the warehouse
+	translated to (0,0), and if symmetries is True the least text over all
+	the TRANSFORMS.
+	'''
+	return min((_render(warehouse, t), t) for t in (TRANSFORMS if symmetries else TRANSFORMS[:1]))
+
+def action_map(transform):
+	'''
+	The dict turning each action into the action it becomes under transform.
+	'''
+	moved = _apply(transform, sokoban.DELTAS)
+	return dict((action, sokoban.ACTIONS[sokoban.DELTAS.index(delta)])
+		for action, delta in zip(sokoban.ACTIONS, moved))
+
+class SolutionCache:
+	'''
+	Solutions (lists of actions, or ['Impossible']) of warehouses, stored in
+	the file solutions.sqlite of 'directory'. Several processes can share
+	it, each opens its own connection.
+	Counts self.hits and self.misses of get.
+	'''
+
+	def __init__(self, directory, max_entries = 10000, symmetries = True):
+		self.directory = directory
+		self.path = os.path.join(directory, 'solutions.sqlite')
+		self.max_entries = max_entries
+		self.symmetries = symmetries
+		self.hits = self.misses = 0
+		self._db = self._pid = None
+
+	def _connection(self):
+		#one connection per process, they don't survive a fork
+		if self._pid != os.getpid():
+			os.makedirs(self.directory, exist_ok = True)
+			self._db = sqlite3.connect(self.path, timeout = 60)
+			with self._db:
+				self._db.execute('CREATE TABLE IF NOT EXISTS solutions '
+					'(key TEXT PRIMARY KEY, actions TEXT NOT NULL, used REAL NOT NULL)')
+				self._db.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+			self._pid = os.getpid()
+		return self._db
+
+	def key(self, warehouse, kind):
+		'''
+		Return the key of the warehouse solved by 'kind' (the solver and its
+		options), and the transform to the canonical frame of the warehouse.
+		'''
+		text, transform = canonical(warehouse, self.symmetries)
+		return hashlib.sha1((kind + '\n' + text).encode()).hexdigest(), transform
+
+	def get(self, warehouse, kind):
+		'''
+		Return the cached solution of the warehouse by 'kind', or None.
+		'''
+		key, transform = self.key(warehouse, kind)
+		db = self._connection()
+		row = db.execute('SELECT actions FROM solutions WHERE key = ?', (key,)).fetchone()
+		if row is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		with db:
+			db.execute('UPDATE solutions SET used = ? WHERE key = ?', (time.time(), key))
+		actions = row[0].split(',') if row[0] else []
+		if actions == ['Impossible']:
+			return actions
+		back = dict((new, old) for old, new in action_map(transform).items())
+		return [back[action] for action in actions]
+
+	def put(self, warehouse, kind, actions):
+		'''
+		Store the solution of the warehouse by 'kind', evicting the least
+		recently used entries beyond self.max_entries.
+		'''
+		key, transform = self.key(warehouse, kind)
+		if actions != ['Impossible']:
+			forward = action_map(transform)
+			actions = [forward[action] for action in actions]
+		db = self._connection()
+		with db:
+			db.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+				(key, ','.join(actions), time.time()))
+			db.execute('DELETE FROM solutions WHERE key IN (SELECT key FROM solutions '
+				'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+	def __len__(self):
+		return self._connection().execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+	def stats(self):
+		'''
+		Return the hits and misses of this process, and the number of entries.
+		'''
+		return dict(hits = self.hits, misses = self.misses, entries = len(self))
+
+	def clear(self):
+		with self._connection() as db:
+			db.execute('DELETE FROM solutions')
+
+_cache = None
+
+def set_cache(cache):
+	'''
+	Use cache (a SolutionCache, or None to turn caching off) in front of the
+	solvers.
+	'''
+	global _cache
+	_cache = cache
+
+def get_cache():
+	'''
+	Return the SolutionCache in use, or None. Without set_cache, it is one
+	in the directory named by the SOKOBAN_CACHE_DIR environment variable,
+	if set.
+	'''
+	global _cache
+	if _cache is None and os.environ.get('SOKOBAN_CACHE_DIR'):
+		_cache = SolutionCache(os.environ['SOKOBAN_CACHE_DIR'])
+	return _cache
+
+def cached(solver):
+	'''
+	Decorate a solver of a warehouse (with options) returning a list of
+	actions, to look its solutions up in the cache in use first.
+	The solver name and its options are part of the key.
+	'''
+	signature = inspect.signature(solver)
+
+	@functools.wraps(solver)
+	def cached_solver(warehouse, *args, **kwargs):
+		cache = get_cache()
+		if cache is None:
+			return solver(warehouse, *args, **kwargs)
+		options = signature.bind(warehouse, *args, **kwargs)
+		options.apply_defaults()
+		kind = '{0}({1})'.format(solver.__name__, ', '.join('{0}={1!r}'.format(name, value)
+			for name, value in list(options.arguments.items())[1:]))
+		actions = cache.get(warehouse, kind)
+		if actions is None:
+			actions = solver(warehouse, *args, **kwargs)
+			cache.put(warehouse, kind, actions)
+		return actions
+
+	return cached_solver
@@ -0,0 +1,152 @@
+'''
+Breadth first search of the elementary Sokoban moves a whole layer at a
+time with NumPy, the layered mode of puzzler.solve_sokoban_elem.
+
+A state is a row of unsigned 64 bit words: the worker cell, then a bitset
+of the box cells. Cells are renumbered over the floor the worker can reach
+(and the cells of the boxes), so the bitset has one bit per such cell.
+A layer is an array of such rows. Its successors in the four directions are
+generated with neighbour table lookups over the whole array, and
+deduplicated with np.unique, then merged into the sorted array of the
+visited states. Each layer keeps the parent row and the direction of its
+states so the solution is read back from the last layer.
+
+NumPy is optional, breadth_first_layers raises ImportError without it.
+'''
+
+try:
+	import numpy as np
+except ImportError: #the layered search is not available
+	np = None
+
+import sokoban
+
+def breadth_first_layers(puzzle):
+	'''
+	Breadth first search of a SokobanPuzzle made without cgt_goal. Like the
+	search of its actions, no box is pushed onto a taboo cell, but freeze
+	deadlocks are not checked, so more states may be visited.
+
+	@param puzzle: a SokobanPuzzle
+
+	@return
+	    the list of elementary actions of a solution with the fewest moves,
+	    or None if the puzzle can't be solved
+	'''
+	if np is None:
+		raise ImportError('the layered search needs NumPy')
+	board = puzzle.board
+	start = puzzle.initial
+
+	#the cells the worker can reach if there were no boxes, and the boxes
+	cells, seen = [start.worker], set([start.worker])
+	for cell in cells:
+		for move in board.moves:
+			if move[cell] >= 0 and move[cell] not in seen:
+				seen.add(move[cell])
+				cells.append(move[cell])
+	cells = sorted(seen.union(start.boxes))
+	number = dict((cell, n) for n, cell in enumerate(cells))
+	words = (len(cells) + 63) // 64
+
+	#step[d][n] is the number of the cell next to cell number n in
+	#direction ACTIONS[d], or -1
+	step = np.array([[number.get(move[cell], -1) for cell in cells] for move in board.moves],
+		dtype=np.int64)
+	taboo = np.array([bool(puzzle.taboos[cell]) for cell in cells])
+	off_target = ~_encode(0, [number[t] for t in puzzle.targets if t in number], words)[1:]
+
+	layer = _encode(number[start.worker], [number[b] for b in start.boxes], words)[None, :]
+	visited = _keys(layer)
+	history = [] #(parent rows, directions) of each layer
+
+	while len(layer):
+		goals = np.flatnonzero(((layer[:, 1:] & off_target) == 0).all(axis=1))
+		if len(goals):
+			return _solution(history, int(goals[0]))
+
+		states, parents, directions = _expand(layer, step, taboo)
+		if not len(states):
+			break
+		keys, first = np.unique(_keys(states), return_index=True)
+		#merge the new keys into the sorted visited keys
+		position = np.searchsorted(visited, keys)
+		fresh = visited[np.minimum(position, len(visited) - 1)] != keys
+		fresh |= position == len(visited)
+		first = first[fresh]
+		visited = np.insert(visited, position[fresh], keys[fresh])
+		layer = states[first]
+		history.append((parents[first], directions[first]))
+
+	return None
+
+def _encode(worker, boxes, words):
+	#the row of a state, from cell numbers
+	row = np.zeros(1 + words, dtype=np.uint64)
+	row[0] = worker
+	for box in boxes:
+		row[1 + box // 64] |= np.uint64(1) << np.uint64(box % 64)
+	return row
+
+def _keys(states):
+	#the rows of states as single values, for np.unique and np.searchsorted
+	states = np.ascontiguousarray(states)
+	return states.view(np.dtype((np.void, states.shape[1] * 8))).ravel()
+
+def _bits(cells):
+	#word column and bit mask of each cell number
+	return 1 + (cells >> 6), np.uint64(1) << (cells & 63).astype(np.uint64)
+
+def _has_box(layer, rows, cells):
+	columns, masks = _bits(cells)
+	return (layer[rows, columns] & masks) != 0
+
+def _expand(layer, step, taboo):
+	'''
+	All the successors of the states of layer, with the row of their parent
+	and the direction taken: the worker steps onto a free cell, or pushes a
+	box onto a free cell that is not taboo.
+	'''
+	rows = np.arange(len(layer))
+	worker = layer[:, 0].astype(np.int64)
+	states, parents, directions = [], [], []
+
+	for d in range(len(sokoban.ACTIONS)):
+		position = step[d][worker]
+		moving = rows[position >= 0]
+		position = position[moving]
+		pushing = _has_box(layer, moving, position)
+
+		#steps onto a free cell
+		free = moving[~pushing]
+		moved = layer[free]
+		moved[:, 0] = position[~pushing]
+
+		#pushes
+		pushers, box = moving[pushing], position[pushing]
+		check = step[d][box]
+		legal = check >= 0
+		pushers, box, check = pushers[legal], box[legal], check[legal]
+		legal = ~taboo[check] & ~_has_box(layer, pushers, check)
+		pushers, box, check = pushers[legal], box[legal], check[legal]
+		pushed = layer[pushers]
+		pushed[:, 0] = box
+		n = np.arange(len(pushers))
+		columns, masks = _bits(box)
+		pushed[n, columns] &= ~masks
+		columns, masks = _bits(check)
+		pushed[n, columns] |= masks
+
+		states += [moved, pushed]
+		parents += [free, pushers]
+		directions.append(np.full(len(free) + len(pushers), d, dtype=np.uint8))
+
+	return np.concatenate(states), np.concatenate(parents), np.concatenate(directions)
+
+def _solution(history, row):
+	#the actions leading to the state on 'row' of the last layer
+	actions = []
+	for parents, directions in reversed(history):
+		actions.append(sokoban.ACTIONS[directions[row]])
+		row = parents[row]
+	return actions[::-1]
@@ -1,24 +1,102 @@
 import search
 import sokoban
+from cache import cached
+from reachability import worker_region, reachability
+from verify import replay
 import time
+import random
+from array import array
 import os
 import sys
 from functools import partial
-from threading import Thread
+from threading import Lock, Thread
+from collections import OrderedDict
+
+class SokobanState(object):
+	'''
+	An immutable search state: the worker cell and the set of box cells.
+	Walls, targets and taboo cells never change so they are kept on the problem.
+	Box order does not matter for equality.
+	The state carries its Zobrist hash and the number of boxes off target,
+	both updated incrementally by SokobanPuzzle.result when a box moves.
+	Use SokobanPuzzle.make_state to build a state from scratch.
+	'''
+	__slots__ = ('worker', 'boxes', '_hash', 'off_target')
+
+	def __init__(self, worker, boxes, hash, off_target):
+		self.worker = worker
+		self.boxes = boxes #a frozenset
+		self._hash = hash
+		self.off_target = off_target
+
+	def __eq__(self, other):
+		return self._hash == other._hash and self.worker == other.worker and self.boxes == other.boxes
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return self._hash
+
+	def __repr__(self):
+		return 'SokobanState({0}, {1})'.format(self.worker, sorted(self.boxes))
+
+def zobrist_keys(size, seed=0):
+	'''
+	Two lists of random 64 bit keys, for a worker and for a box on each of
+	'size' cells. The seed is fixed so hashes are the same in every process.
+	'''
+	rng = random.Random(seed)
+	return ([rng.getrandbits(64) for i in range(size)],
+		[rng.getrandbits(64) for i in range(size)])
+
+#heuristics of SokobanPuzzle.h
+HEURISTICS = ('manhattan', 'push', 'matching')
+
+#push distance of a cell from which a box can't reach the target
+UNREACHABLE = 0xFFFF
 
 class SokobanPuzzle(search.Problem):
 
 	#warehouse walls, goals, and taboos stay the same
 	#boxes and player move so that is the "state"
-
-	def __init__(self, warehouse, cgt_goal = None):
-		self.initial = warehouse
+	#positions are cell indices of the compiled sokoban.Board
+
+	def __init__(self, warehouse, cgt_goal = None, heuristic = 'matching', deadlocks = True):
+		self.warehouse = warehouse
+		self.board = board = warehouse.compile()
+		self.targets = frozenset(board.targets)
+		self.zobrist_worker, self.zobrist_box = zobrist_keys(board.size)
+		self.initial = self.make_state(board.index(*warehouse.worker),
+			[board.index(x,y) for (x,y) in warehouse.boxes])
+		
+		#taboo flag per cell
 		self.taboos = gen_taboos(warehouse)
 		
+		#check for frozen boxes after each push, see SokobanPuzzle.deadlocked
+		self.deadlocks = deadlocks
+		self.deadlocks_pruned = 0 #pushes rejected by the check
+		
 		if cgt_goal is not None:
-			self.cgt_goal = (cgt_goal[1]-1,cgt_goal[0]-1) #cgt is given in (row,col) format
+			x,y = cgt_goal[1]-1,cgt_goal[0]-1 #cgt is given in (row,col) format
+			if 0 <= x < board.width and 0 <= y < board.height:
+				self.cgt_goal = board.index(x,y)
+			else:
+				self.cgt_goal = -1 #off the board, never reached
 		else:
 			self.cgt_goal = None
+		
+		#distance tables for the heuristics, see SokobanPuzzle.h
+		if heuristic not in HEURISTICS:
+			raise ValueError('unknown heuristic {0!r}, expected one of {1}'.format(heuristic, HEURISTICS))
+		self.heuristic = heuristic
+		self.distances = push_distances(board)
+		self.nearest = [min(column) for column in zip(*self.distances)]
+		for cell, distance in enumerate(self.nearest):
+			if distance == UNREACHABLE: #a box there can never reach a target
+				self.taboos[cell] = 1
+		self.manhattan = [min(abs(x-tx)+abs(y-ty) for (tx,ty) in warehouse.targets)
+			for (x,y) in map(board.coord, range(board.size))]
 
 	def actions(self, state):
 		"""
@@ -26,89 +104,190 @@ class SokobanPuzzle(search.Problem):
 		if these actions do not push a box in a taboo cell.
 		The actions must belong to the list ['Left', 'Down', 'Right', 'Up']        
 		"""
-		px,py = state.worker
+		worker = state.worker
+		boxes = state.boxes
+		pushes = self.board.pushes
 		actions = []
 		
 		#for each action, check if we're 1.pushing a box into a taboo or 2. moving into empty space
 		
-		ac = ['Up','Down','Left','Right']
-		position = [(px,py-1),(px,py+1),(px-1,py),(px+1,py)]
-		check = [(px,py-2),(px,py+2),(px-2,py),(px+2,py)]
-		
-		for i in range(0,4):
+		for d,move in enumerate(self.board.moves):
+			position = move[worker]
+			
+			if position < 0: #a wall
+				#skip this
+				continue
 
-			if position[i] in state.boxes:
+			if position in boxes:
 				if self.cgt_goal is not None:
 					continue
 				
 				#we're not moving a box into a taboo, walls, or into other boxes.
-				if check[i] in self.taboos or check[i] in state.walls or check[i] in state.boxes:
+				check = pushes[d][worker]
+				if check < 0 or self.taboos[check] or check in boxes:
 					#skip this
 					continue
 				
-			if position[i] in state.walls:
-				#skip this
-				continue
+				#nor freezing boxes off target
+				if self.deadlocks and self.deadlocked(boxes.difference([position]).union([check]), check):
+					continue
 			
-			actions.append(ac[i])
+			actions.append(sokoban.ACTIONS[d])
 			
 		return actions
 
-	def result(self, s, action):
+	def result(self, state, action):
 		#return the state resolved from executing action
+		#an illegal action leaves the state as it is
 		
-		state = s.copy(boxes=list(s.boxes)) #we return a copy of the state
-		
-		nx,ny = state.worker
-		cx,cy = state.worker
-	
-		if(action is 'Up'):
-			ny -= 1
-			cy -= 2
-		elif(action is 'Down'):
-			ny += 1
-			cy += 2
-		elif(action is 'Right'):
-			nx += 1
-			cx += 2
-		elif(action is 'Left'):
-			nx -= 1
-			cx -= 2
-
-		if (nx,ny) in state.walls: #can't move into a wall
+		d = sokoban.ACTIONS.index(action)
+		position = self.board.moves[d][state.worker] #where the worker goes
+
+		if position < 0: #can't move into a wall
 			return state
 		
-		if (self.cgt_goal is not None): #if we're cgt, then can't move into a box
-			if (nx,ny) in state.boxes:
-				return state
+		if position in state.boxes: #if we're moving into a box
 
-		for thebox,box in enumerate(state.boxes):
-			if (nx,ny) == box: #if we're moving into a box
+			if self.cgt_goal is not None: #if we're cgt, then can't move into a box
+				return state
 
-				if (cx,cy) in state.boxes or (cx,cy) in state.walls: #if we're moving the box into another box or wall
+			check = self.board.pushes[d][state.worker] #where a pushed box goes
+			if check < 0 or check in state.boxes: #if we're moving the box into another box or wall
 
-					#can't do anything. return state
-					return state
-				else: #move box
-					state.boxes[thebox] = (cx,cy) # move it to where we forcasted
-				break
+				#can't do anything. return state
+				return state
 
-		state.worker = (nx,ny)
-		
-		return state
+			#move box to where we forcasted
+			return self.push_state(state, position, check, position)
+
+		zobrist = self.zobrist_worker
+		return SokobanState(position, state.boxes,
+			state._hash ^ zobrist[state.worker] ^ zobrist[position], state.off_target)
+
+	def make_state(self, worker, boxes):
+		#build a state, computing its hash and boxes off target from scratch
+		boxes = frozenset(boxes)
+		key = self.zobrist_worker[worker]
+		for box in boxes:
+			key ^= self.zobrist_box[box]
+		return SokobanState(worker, boxes, key, len(boxes - self.targets))
+
+	def push_state(self, state, box, check, worker):
+		#the state after the box on cell 'box' moved to cell 'check' and the
+		#worker to cell 'worker', updating the hash and boxes off target
+		zw = self.zobrist_worker
+		zb = self.zobrist_box
+		targets = self.targets
+		return SokobanState(worker, state.boxes.difference([box]).union([check]),
+			state._hash ^ zw[state.worker] ^ zw[worker] ^ zb[box] ^ zb[check],
+			state.off_target + (box in targets) - (check in targets))
 	
+	def deadlocked(self, boxes, box):
+		'''
+		Return True if the box just pushed to cell 'box' is frozen (can never
+		move again) together with a box that is not on a target.
+		A box is frozen if it is blocked both vertically and horizontally.
+		It is blocked along an axis by a wall on either side, by taboo cells on
+		both sides, or by a neighbouring box that is itself frozen. Only the
+		boxes around the pushed one are looked at.
+		Counts the rejected pushes in self.deadlocks_pruned.
+		'''
+		frozen = []
+		if self._frozen(box, boxes, set(), frozen) and \
+		any(b not in self.targets for b in frozen):
+			self.deadlocks_pruned += 1
+			return True
+		return False
+
+	def _frozen(self, box, boxes, walls, frozen):
+		#boxes in 'walls' are being checked further up, and count as walls.
+		#the boxes found frozen are appended to 'frozen'
+		moves = self.board.moves
+		taboos = self.taboos
+		mark = len(frozen)
+		walls.add(box)
+		
+		for d in (0, 2): #the vertical then the horizontal axis
+			a, b = moves[d][box], moves[d^1][box]
+			if a < 0 or b < 0 or a in walls or b in walls:
+				continue
+			if taboos[a] and taboos[b]:
+				continue
+			if a in boxes and self._frozen(a, boxes, walls, frozen):
+				continue
+			if b in boxes and self._frozen(b, boxes, walls, frozen):
+				continue
+			#free to move along this axis
+			walls.discard(box)
+			del frozen[mark:]
+			return False
+		
+		walls.discard(box)
+		frozen.append(box)
+		return True
+
+	def h(self, node):
+		'''
+		Lower bound on the number of pushes left, which is also a lower
+		bound on the number of moves. self.heuristic selects one of
+		  'manhattan': sum of the Manhattan distances of each box to its nearest target
+		  'push': sum of the push distances of each box to its nearest target
+		  'matching': cost of the cheapest assignment of boxes to distinct
+		              targets, using push distances
+		Returns infinity if a box can no longer reach a target.
+		'''
+		boxes = node.state.boxes
+		
+		if self.heuristic == 'manhattan':
+			return sum(self.manhattan[box] for box in boxes)
+		
+		if self.heuristic == 'push':
+			estimate = sum(self.nearest[box] for box in boxes)
+			return estimate if max(self.nearest[box] for box in boxes) < UNREACHABLE else float('inf')
+		
+		cost = [[distance[box] for distance in self.distances] for box in boxes]
+		estimate = 0
+		for row, column in min_cost_matching(cost):
+			if cost[row][column] == UNREACHABLE:
+				return float('inf')
+			estimate += cost[row][column]
+		return estimate
+
+	def encode_state(self, state):
+		#the worker and box cells as 16 bit integers, for checkpoints
+		return array('H', [state.worker] + sorted(state.boxes)).tobytes()
+
+	def decode_state(self, data):
+		cells = array('H')
+		cells.frombytes(data)
+		return self.make_state(cells[0], cells[1:])
+
+	def encode_action(self, action):
+		#elementary actions are 0-3
+		return sokoban.ACTIONS.index(action)
+
+	def decode_action(self, code):
+		return sokoban.ACTIONS[code]
+
+	def to_warehouse(self, state):
+		#build a Warehouse for a state, for printing and animation
+		coord = self.board.coord
+		return self.warehouse.copy(worker=coord(state.worker),
+			boxes=[coord(box) for box in sorted(state.boxes)])
+
 	def print_solution(self,goal_node):
 		path = goal_node.path()
 		
 		print("solution takes {0} moves".format(len(path)-1))
-		print(path[0].state)
+		print("{0} deadlocked pushes pruned".format(self.deadlocks_pruned))
+		print(self.to_warehouse(path[0].state))
 		print("to solution:")
-		print(path[-1].state)
+		print(self.to_warehouse(path[-1].state))
 		print("moves:")
 		
 		for node in path:
 			print(node.action)
-			print(node.state)
+			print(self.to_warehouse(node.state))
 
 	def goal_path(self,goal_node):
 		path = goal_node.path()
@@ -122,97 +301,359 @@ class SokobanPuzzle(search.Problem):
 			return state.worker == self.cgt_goal
 		
 		else:	#sokoban goal test - every box on a goal
-			return str(state).count('$') == 0
+			return state.off_target == 0
 	
 	
-def gen_taboos(warehouse):
+class SokobanMacroPuzzle(SokobanPuzzle):
+
+	#push-level version of the puzzle. the actions are box pushes only,
+	#the walk to the pushing position is free. the worker of a state is
+	#the lowest cell index of the region it can walk to, so states that
+	#differ only by where the worker stands in that region are the same.
+
+	def __init__(self, warehouse, heuristic = 'matching', deadlocks = True):
+		SokobanPuzzle.__init__(self, warehouse, heuristic=heuristic, deadlocks=deadlocks)
+		self.start = self.initial #real worker position, for expanding the solution
+		self.initial = self.normalize(self.initial)
+
+	def normalize(self, state):
+		#the state of a worker standing anywhere in its region
+		region, lowest = worker_region(self.board, state.worker, state.boxes)
+		if lowest == state.worker:
+			return state
+		zobrist = self.zobrist_worker
+		return SokobanState(lowest, state.boxes,
+			state._hash ^ zobrist[state.worker] ^ zobrist[lowest], state.off_target)
 
-	#the start of anything great starts with an empty list
-	taboo = []
+	def actions(self, state):
+		"""
+		Return the list of pushes (box, direction) that the worker can reach
+		in the given state, without pushing a box in a taboo cell.
+		box is the cell index of the box, direction one of sokoban.ACTIONS
+		"""
+		region, lowest = worker_region(self.board, state.worker, state.boxes)
+		boxes = state.boxes
+		actions = []
+		
+		for box in boxes:
+			for d,move in enumerate(self.board.moves):
+				behind = self.board.moves[d^1][box] #where the worker pushes from
+				check = move[box] #where the box goes
+				
+				if behind < 0 or not region[behind]:
+					continue
+				if check < 0 or self.taboos[check] or check in boxes:
+					continue
+				if self.deadlocks and self.deadlocked(boxes.difference([box]).union([check]), check):
+					continue
+				
+				actions.append((box, sokoban.ACTIONS[d]))
+		
+		return actions
+
+	def result(self, state, action):
+		#push the box, the worker ends up where the box was
+		box, direction = action
+		check = self.board.moves[sokoban.ACTIONS.index(direction)][box]
+		return self.normalize(self.push_state(state, box, check, box))
+
+	def encode_action(self, action):
+		#a push (box, direction) is box*4+direction
+		box, direction = action
+		return box*4 + sokoban.ACTIONS.index(direction)
+
+	def decode_action(self, code):
+		return (code // 4, sokoban.ACTIONS[code % 4])
+
+	def elementary_solution(self, goal_node):
+		#expand the pushes of the solution into Left/Right/Up/Down moves
+		moves = self.board.moves
+		worker = self.start.worker
+		boxes = self.start.boxes
+		solution = []
+		
+		for box, direction in goal_node.solution():
+			d = sokoban.ACTIONS.index(direction)
+			solution += walk_path(self.board, worker, moves[d^1][box], boxes)
+			solution.append(direction)
+			boxes = boxes.difference([box]).union([moves[d][box]])
+			worker = box
+		
+		return solution
+
+	def goal_path(self, goal_node):
+		#the elementary nodes of the solution, for the animation
+		node = search.Node(self.start)
+		path = []
+		
+		for action in self.elementary_solution(goal_node):
+			state = SokobanPuzzle.result(self, node.state, action)
+			node = search.Node(state, node, action, node.path_cost+1)
+			path.append(node)
+		
+		return path
 	
-	#go along the walls and find corners
-	for (x,y) in warehouse.walls:
-		#if we have a gap on the right, ( left wall ) and a wall above or below that:
-		if (x+1,y) not in warehouse.walls and (
-		(x+1,y+1) in warehouse.walls or (x+1,y-1) in warehouse.walls):
-			taboo.append((x+1,y))
-			
-		#and for the gap on the left ( right wall ) yadda yadda
-		if(x-1,y) not in warehouse.walls and (
-		(x-1,y+1) in warehouse.walls or (x-1,y-1) in warehouse.walls):
-			taboo.append((x-1,y))
 
+class SokobanPullPuzzle(SokobanMacroPuzzle):
+
+	#the macro puzzle played backwards, for bidirectional search: the worker
+	#pulls boxes away from the targets. the initial states are the solved
+	#states (all the boxes on targets, the worker in any region), and the
+	#goal is the initial state of the forward SokobanMacroPuzzle
+
+	def __init__(self, warehouse):
+		SokobanMacroPuzzle.__init__(self, warehouse, deadlocks=False)
+		self.goal = self.initial
+		
+		#one solved state per region the worker can be in
+		board = self.board
+		boxes = self.targets
+		inside, lowest = worker_region(board, self.start.worker, ())
+		seen = bytearray(board.size)
+		self.initial = []
+		for cell in range(board.size):
+			if inside[cell] and not seen[cell] and cell not in boxes:
+				region, lowest = worker_region(board, cell, boxes)
+				seen = bytearray(a | b for a, b in zip(seen, region))
+				self.initial.append(self.make_state(lowest, boxes))
+
+	def actions(self, state):
+		"""
+		Return the list of pulls (box, direction) that the worker can reach
+		in the given state: the box moves one cell in direction, onto the
+		cell the worker stands on, and the worker steps back.
+		"""
+		region, lowest = worker_region(self.board, state.worker, state.boxes)
+		boxes = state.boxes
+		actions = []
+		
+		for box in boxes:
+			for d,move in enumerate(self.board.moves):
+				worker = move[box] #where the worker pulls from
+				if worker < 0 or not region[worker]:
+					continue
+				back = self.board.pushes[d][box] #where the worker steps back to
+				if back < 0 or back in boxes:
+					continue
+				actions.append((box, sokoban.ACTIONS[d]))
+		
+		return actions
+
+	def result(self, state, action):
+		#pull the box, the worker steps back one more cell
+		box, direction = action
+		d = sokoban.ACTIONS.index(direction)
+		return self.normalize(self.push_state(state, box, self.board.moves[d][box], self.board.pushes[d][box]))
 
-	#remove any taboos that are targets
-	taboo = [t for t in taboo if t not in warehouse.targets]
+	def invert(self, action):
+		#the push of SokobanMacroPuzzle that undoes a pull
+		box, direction = action
+		d = sokoban.ACTIONS.index(direction)
+		return (self.board.moves[d][box], sokoban.ACTIONS[d^1])
+
+	def goal_test(self, state):
+		return state == self.goal
 	
-	#check if outside play area ( should not be inline with the topmost, bottommost, etc)
-	#ex = get x component, etc. shortcut
-	ex = lambda x:x[0]
-	ey = lambda x:x[1]
+
+def walk_path(board, start, goal, boxes):
+	'''
+	Return the shortest list of actions walking the worker from cell start
+	to cell goal without pushing a box, or None if goal is not reachable.
+	'''
+	parent = {start: None}
+	frontier = [start]
 	
-	topmost = min(warehouse.walls, key=ey)
-	botmost = max(warehouse.walls, key=ey)
-	rigmost = max(warehouse.walls, key=ex)
-	lefmost = min(warehouse.walls, key=ex)
+	while frontier and goal not in parent:
+		layer = []
+		for i in frontier:
+			for d,move in enumerate(board.moves):
+				j = move[i]
+				if j >= 0 and j not in parent and j not in boxes:
+					parent[j] = (i, d)
+					layer.append(j)
+		frontier = layer
+	
+	if goal not in parent:
+		return None
+	
+	path = []
+	while parent[goal] is not None:
+		goal, d = parent[goal]
+		path.append(sokoban.ACTIONS[d])
+	return path[::-1]
+
 
-	#trim any that are inline with topmost, etc.
-	taboo = [ t for t in taboo if ey(t) is not ey(topmost) and ey(t) is not ey(botmost) and ex(t) is not ex(rigmost) and ex(t) is not ex(lefmost)]
+#push distance tables by board fingerprint, the least recently used beyond
+#PUSH_DISTANCES_CACHED are dropped
+PUSH_DISTANCES_CACHED = 64
+_push_distances_cache = OrderedDict()
+_push_distances_lock = Lock()
 
+def push_distances(board):
+	'''
+	For each target of the board, the minimum number of pushes needed to
+	bring a box from each cell to that target, ignoring the other boxes.
+	Computed by a breadth first search of box pulls from each target, once
+	per layout of walls and targets (keyed by board.fingerprint), keeping
+	the tables of the last PUSH_DISTANCES_CACHED layouts.
+
+	@return
+	    a tuple with one array('H') per target (in board.targets order),
+	    holding the push distance of every cell, or UNREACHABLE
+	'''
+	key = board.fingerprint
+	with _push_distances_lock:
+		distances = _push_distances_cache.get(key)
+		if distances is not None:
+			_push_distances_cache.move_to_end(key)
+			return distances
+	distances = tuple(_pull_distances(board, target) for target in board.targets)
+	with _push_distances_lock:
+		_push_distances_cache[key] = distances
+		while len(_push_distances_cache) > PUSH_DISTANCES_CACHED:
+			_push_distances_cache.popitem(last=False)
+	return distances
+
+def _pull_distances(board, target):
+	#breadth first search of box pulls from target
+	moves = board.moves
+	distance = array('H', [UNREACHABLE]) * board.size
+	distance[target] = 0
+	frontier = [target]
 	
-	#get a list of taboos that are inline with each other ( a pair)
-	#0^2 time here, probably really bad
-	taboo_pairs = []
-	for t in taboo:
-		for T in taboo:
-			if (T[0] == t[0] or t[1] == T[1]) and T is not t:
-				if [T,t] not in taboo_pairs or [t,T] not in taboo_pairs:   
-					#print(T,t])
-					taboo_pairs.append([t,T])
-
-	#have a list of pairs that we calculate between them.
-	for pair in taboo_pairs:
-		wall_check = 0		#wall runner
-		gap = False		#a gap was found ( not taboo ) 
-		a,b = pair[0],pair[1] #each taboo
-		
-		if(a[0] == b[0]): #x components are the same, so check along y
-			# (2,2) -> (2,6)
-			
-			if(a[0]+1,a[1]) in warehouse.walls: #check which side wall is on
-				wall_check=a[0]+1
-			else: #it was on the other side
-				wall_check=a[0]-1
-		
-			#run along wall, see if there's a gap
-			for i in range(a[1],b[1]): # each cell between a and b
-				if (wall_check,i) not in warehouse.walls or (a[0],i) in warehouse.walls or (a[0],i) in warehouse.targets:
-					#there's a gap in the wall or we ran into a wall.
-					gap = True
-					
-			#if we didn't have a gap, paint the entire wall
-			if not gap:
-				for i in range(a[1],b[1]):
-					taboo.append((a[0],i)) #append a whole lotta taboos
+	while frontier:
+		layer = []
+		for box in frontier:
+			for d in range(4):
+				#a box at 'previous' pushed in direction d lands on 'box',
+				#the worker stands behind it
+				previous = moves[d^1][box]
+				if previous < 0 or distance[previous] != UNREACHABLE:
+					continue
+				if moves[d^1][previous] < 0:
+					continue
+				distance[previous] = distance[box] + 1
+				layer.append(previous)
+		frontier = layer
+	
+	return distance
 
-			
-		else: #check along x direction
-			
-			if(a[0],a[1]+1) in warehouse.walls: #check which side wall is on
-				wall_check=a[1]+1
-			else: #it was on the other side
-				wall_check=a[1]-1
+def min_cost_matching(cost):
+	'''
+	Hungarian algorithm for the rectangular assignment problem.
+	cost is a list of n rows of m >= n costs.
+	
+	@return
+	    a list of (row, column) pairs, one per row, with distinct columns,
+	    minimising the total cost
+	'''
+	n = len(cost)
+	if n == 0:
+		return []
+	m = len(cost[0])
+	inf = float('inf')
+	
+	#potentials of the rows (u) and columns (v), and the row matched to
+	#each column (p). index 0 is a dummy, rows and columns count from 1
+	u = [0] * (n+1)
+	v = [0] * (m+1)
+	p = [0] * (m+1)
+	way = [0] * (m+1)
+	
+	for i in range(1, n+1):
+		p[0] = i
+		j0 = 0
+		minv = [inf] * (m+1)
+		used = [False] * (m+1)
 		
-			#run along wall, see if there's a gap
-			for i in range(a[0],b[0]): #between a and b
-				if (i,wall_check) not in warehouse.walls or (i,a[1]) in warehouse.walls or (i,a[1]) in warehouse.targets:
-					#there's a gap in the wall or we ran into one
-					gap = True
+		while True:
+			#grow the alternating tree until a free column is found
+			used[j0] = True
+			i0 = p[j0]
+			row = cost[i0-1]
+			delta = inf
+			j1 = 0
+			for j in range(1, m+1):
+				if not used[j]:
+					cur = row[j-1] - u[i0] - v[j]
+					if cur < minv[j]:
+						minv[j] = cur
+						way[j] = j0
+					if minv[j] < delta:
+						delta = minv[j]
+						j1 = j
+			for j in range(m+1):
+				if used[j]:
+					u[p[j]] += delta
+					v[j] -= delta
+				else:
+					minv[j] -= delta
+			j0 = j1
+			if p[j0] == 0:
+				break
 		
-			if not gap:
-				for i in range(a[0],b[0]):
-					taboo.append((i,a[1])) #append a whole lotta taboos
+		#flip the augmenting path
+		while j0:
+			j1 = way[j0]
+			p[j0] = p[j1]
+			j0 = j1
+	
+	return [(p[j]-1, j-1) for j in range(1, m+1) if p[j]]
+
+def gen_taboos(warehouse):
+	'''
+	Find the taboo cells of rule 1 and rule 2 (see taboo_cells) with one
+	pass over the cells, then one pass along the rows and the columns of
+	the compiled board. Only cells the worker can walk to (ignoring the
+	boxes) are considered, the outside of the warehouse is never taboo.
+
+	@return
+	    a bytearray indexed like board.cells, 1 for the taboo cells
+	'''
+	board = warehouse.compile()
+	cells = board.cells
+	up, down, left, right = board.moves
+	inside, lowest = worker_region(board, board.index(*warehouse.worker), ())
+	taboo = bytearray(board.size)
+	
+	#rule 1: a corner has a wall (or the edge of the board) on two adjacent sides
+	for i in range(board.size):
+		if inside[i] and not cells[i] & sokoban.TARGET and \
+		(up[i] < 0 or down[i] < 0) and (left[i] < 0 or right[i] < 0):
+			taboo[i] = 1
+	corners = bytes(taboo)
+	
+	#rule 2: corners can only be at the ends of a run of cells between two
+	#walls, so look at each run of each row and each column once
+	width = board.width
+	rows = [range(y*width, (y+1)*width) for y in range(board.height)]
+	columns = [range(x, board.size, width) for x in range(width)]
+	_taboo_runs(rows, cells, corners, up, down, taboo)
+	_taboo_runs(columns, cells, corners, left, right, taboo)
+	
 	return taboo
+
+def _taboo_runs(lines, cells, corners, side_a, side_b, taboo):
+	#mark each run of a line that goes from corner to corner, has no target,
+	#and has a wall all along one side
+	for line in lines:
+		run = []
+		for i in line:
+			if not cells[i] & sokoban.WALL:
+				run.append(i)
+				continue
+			_taboo_run(run, cells, corners, side_a, side_b, taboo)
+			run = []
+		_taboo_run(run, cells, corners, side_a, side_b, taboo)
+
+def _taboo_run(run, cells, corners, side_a, side_b, taboo):
+	if len(run) < 2 or not corners[run[0]] or not corners[run[-1]]:
+		return
+	if any(cells[i] & sokoban.TARGET for i in run):
+		return
+	if all(side_a[i] < 0 for i in run) or all(side_b[i] < 0 for i in run):
+		for i in run:
+			taboo[i] = 1
 	
 
 def taboo_cells(warehouse):
@@ -235,6 +676,7 @@ def taboo_cells(warehouse):
        and the boxes.  
     '''
 	taboo = gen_taboos(warehouse)
+	coord = warehouse.compile().coord
 					
 	#zip it up
 	#shamelessly copied from example code
@@ -243,8 +685,10 @@ def taboo_cells(warehouse):
 	vis = [[" "] * x_size for y in range(y_size)]
 	for (x,y) in warehouse.walls:
 		vis[y][x] = "#"
-	for (x,y) in taboo:
-		vis[y][x] = "X"
+	for i, flag in enumerate(taboo):
+		if flag:
+			x,y = coord(i)
+			vis[y][x] = "X"
 	
 	return "\n".join(["".join(line) for line in vis])
 
@@ -275,27 +719,25 @@ def check_action_seq(warehouse, action_seq):
 	           the sequence of actions.  This must be the same string as the
 	           string returned by the method  Warehouse.__str__()
 	'''
-	puzzle = SokobanPuzzle(warehouse)
-	old_result = puzzle.initial
-	
-	for action in action_seq:
-		result = puzzle.result(old_result,action)
-		
-		if old_result == result: #action didn't do anything, so it is illegal
-			return 'Failure'
-		old_result = result
-		
-	return old_result
+	checked = replay(warehouse, action_seq)
+	if not checked.legal:
+		return 'Failure'
+	coord = warehouse.compile().coord
+	return warehouse.copy(worker=coord(checked.worker), boxes=[coord(box) for box in checked.boxes])
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def solve_sokoban_elem(warehouse):
+@cached
+def solve_sokoban_elem(warehouse, layered = False):
 	'''    
 	This function should solve using elementary actions 
 	the puzzle defined in a file.
 
 	@param warehouse: a valid Warehouse object
 
+	@param layered: search a whole breadth first layer at a time with
+	       NumPy, see layered.breadth_first_layers
+
 	@return
 	    A list of strings.
 	    If puzzle cannot be solved return ['Impossible']
@@ -306,6 +748,11 @@ def solve_sokoban_elem(warehouse):
 	'''
 	problem = SokobanPuzzle(warehouse)
 	
+	if layered:
+		from layered import breadth_first_layers #imports NumPy, only needed here
+		actions = breadth_first_layers(problem)
+		return ['Impossible'] if actions is None else actions
+	
 	solution = search.breadth_first_graph_search(problem)
 		
 	if solution is not None:
@@ -315,6 +762,86 @@ def solve_sokoban_elem(warehouse):
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+def optimal_puzzle(warehouse, optimal = 'moves', heuristic = 'matching'):
+	'''
+	The puzzle searched by the solvers for a solution with the fewest
+	'moves' (a SokobanPuzzle) or the fewest 'pushes' (a SokobanMacroPuzzle).
+	'''
+	if optimal == 'moves':
+		return SokobanPuzzle(warehouse, heuristic=heuristic)
+	if optimal == 'pushes':
+		return SokobanMacroPuzzle(warehouse, heuristic=heuristic)
+	raise ValueError("optimal must be 'moves' or 'pushes', not {0!r}".format(optimal))
+
+@cached
+def solve_sokoban_astar(warehouse, optimal = 'moves', heuristic = 'matching'):
+	'''
+	Solve the puzzle with A* search and one of the HEURISTICS.
+
+	@param warehouse: a valid Warehouse object
+
+	@param optimal: 'moves' to find a solution with the fewest elementary
+	       actions, or 'pushes' to find a solution with the fewest box pushes
+	       (searching box pushes with SokobanMacroPuzzle, much faster)
+
+	@param heuristic: the name of one of the HEURISTICS
+
+	@return
+	    Same as solve_sokoban_elem
+	'''
+	problem = optimal_puzzle(warehouse, optimal, heuristic)
+	
+	solution = search.astar_graph_search(problem)
+	
+	if solution is not None:
+		return [node.action for node in problem.goal_path(solution)]
+	else:
+		return ['Impossible']
+
+@cached
+def solve_sokoban_ida(warehouse, optimal = 'pushes', heuristic = 'matching', table_size = 1000000):
+	'''
+	Solve the puzzle with IDA* search, which needs little memory: the depth
+	of the search plus a transposition table of at most table_size states.
+	The parameters and the result are the same as solve_sokoban_astar.
+	'''
+	problem = optimal_puzzle(warehouse, optimal, heuristic)
+	
+	solution = search.iterative_deepening_astar_search(problem, table_size=table_size)
+	
+	if solution is not None:
+		return [node.action for node in problem.goal_path(solution)]
+	else:
+		return ['Impossible']
+
+def solve_sokoban_macro(warehouse, heuristic = 'matching'):
+	'''
+	Solve the puzzle with the fewest box pushes, see solve_sokoban_astar
+	'''
+	return solve_sokoban_astar(warehouse, 'pushes', heuristic)
+
+@cached
+def solve_sokoban_bidirectional(warehouse):
+	'''
+	Solve the puzzle with the fewest box pushes, searching box pushes
+	forward from the warehouse and box pulls backward from the solved
+	states until the two searches meet.
+
+	@param warehouse: a valid Warehouse object
+
+	@return
+	    Same as solve_sokoban_elem
+	'''
+	problem = SokobanMacroPuzzle(warehouse)
+	solution = search.bidirectional_breadth_first_search(problem, SokobanPullPuzzle(warehouse))
+	
+	if solution is not None:
+		return problem.elementary_solution(solution)
+	else:
+		return ['Impossible']
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
 def can_go_there(warehouse, dst):
 	'''    
 	Determine whether the worker can walk to the cell dst=(row,col) 
@@ -326,9 +853,6 @@ def can_go_there(warehouse, dst):
 	  True if the worker can walk to cell dst=(row,col) without pushing any box
 	  False otherwise
 	'''
-	#do a simple search to find a path to the place.
-	problem = SokobanPuzzle(warehouse,dst)
-	solution = search.breadth_first_graph_search(problem)
-	
-	return solution is not None
+	x, y = dst[1]-1, dst[0]-1 #dst is given in (row,col) format
+	return reachability(warehouse).reachable(x, y)
 
@@ -0,0 +1,88 @@
+'''
+Where the worker can walk without pushing a box.
+
+One flood fill over the compiled board gives a bitmap of the reachable
+cells, then any number of destinations are looked up in it. The flood fill
+also finds the lowest reachable cell index, the normalized worker position
+of the push level puzzles (see puzzler.SokobanMacroPuzzle).
+'''
+
+def worker_region(board, worker, boxes):
+	'''
+	Flood fill the cells the worker can walk to without pushing a box.
+	boxes should be a set (or frozenset) of cell indices.
+
+	@return
+	    a bytearray flagging the reachable cells,
+	    and the lowest reachable cell index
+	'''
+	region = bytearray(board.size)
+	region[worker] = 1
+	lowest = worker
+	stack = [worker]
+
+	while stack:
+		i = stack.pop()
+		for move in board.moves:
+			j = move[i]
+			if j >= 0 and not region[j] and j not in boxes:
+				region[j] = 1
+				if j < lowest:
+					lowest = j
+				stack.append(j)
+
+	return region, lowest
+
+class Reachability:
+	'''
+	The cells a worker on cell 'worker' can walk to without pushing any of
+	the boxes, on a compiled sokoban.Board.
+	    self.region is a bytearray flagging the reachable cells
+	    self.lowest is the lowest reachable cell index
+	'''
+
+	def __init__(self, board, worker, boxes = ()):
+		self.board = board
+		self.worker = worker
+		self.boxes = frozenset(boxes)
+		self.region, self.lowest = worker_region(board, worker, self.boxes)
+
+	def __contains__(self, cell):
+		#is the cell index reachable
+		return 0 <= cell < self.board.size and self.region[cell] == 1
+
+	def reachable(self, x, y):
+		'''
+		Return True if the worker can walk to position (x,y), which may be
+		off the board.
+		'''
+		board = self.board
+		return 0 <= x < board.width and 0 <= y < board.height and \
+			self.region[board.index(x,y)] == 1
+
+	def cells(self):
+		'''
+		Return the list of the reachable cell indices.
+		'''
+		return [i for i, flag in enumerate(self.region) if flag]
+
+_last = None #the last Reachability of reachability, and its key
+
+def reachability(warehouse):
+	'''
+	Return the Reachability of the worker of a warehouse. The last one is
+	kept, so repeated queries on the same warehouse (same walls, worker and
+	boxes) don't flood fill again. Safe to call from several threads: the
+	cached (key, Reachability) pair is only read and replaced whole.
+	'''
+	global _last
+	board = warehouse.compile()
+	worker = board.index(*warehouse.worker)
+	boxes = frozenset(board.index(x,y) for (x,y) in warehouse.boxes)
+	key = (board.fingerprint, worker, boxes)
+	last = _last #read once, another thread may replace it
+	if last is not None and last[0] == key:
+		return last[1]
+	region = Reachability(board, worker, boxes)
+	_last = (key, region)
+	return region
@@ -6,7 +6,7 @@ import time
 import os
 import sys
 from functools import partial
-from threading import Thread
+from threading import Event, Thread
 
 from puzzler import *
 
@@ -35,14 +35,17 @@ class Solver(Thread):
 		self.warehouse = sokoban.Warehouse()
 		self.warehouse.read_warehouse_file(
 			'./warehouses/'+str(wh_file))
-		self.puzzle = SokobanPuzzle(self.warehouse)
+		self.puzzle = SokobanMacroPuzzle(self.warehouse)
 		self.solution = None
 		self.path = []
 		self.started = False
+		#set to stop the search, which then returns a search.LimitReached
+		self.cancel = Event()
 
 	def run(self):
-		self.solution = search.breadth_first_graph_search(self.puzzle)
-		self.path = [x for x in self.puzzle.goal_path(self.solution)]
+		self.solution = search.astar_graph_search(self.puzzle, cancel = self.cancel)
+		if self.solution:
+			self.path = [x for x in self.puzzle.goal_path(self.solution)]
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 warehouses = sorted(os.listdir('./warehouses/'))
@@ -81,6 +84,8 @@ for w in warehouses[:10]:
 		solutions[w].join(3)
 		animated_solution = solutions[w].path
 		if not animated_solution:
+			#give up on it, rather than leave its thread searching
+			solutions[w].cancel.set()
 			print('.. ok well I had a hard time with this one, but continuing..')
 			time.sleep(1)
 			continue
@@ -89,10 +94,13 @@ for w in warehouses[:10]:
 
 	for node in animated_solution:
 		cls()
-		print(str(node.state))
+		print(str(solutions[w].puzzle.to_warehouse(node.state)))
 		time.sleep(0.1)
 
 	cls()
 	print_goal()
 	time.sleep(1)
 
+#stop the searches still running, so that the program can exit
+for solver in solutions.values():
+	solver.cancel.set()
@@ -7,13 +7,24 @@ from __future__ import division
 import itertools
 
 
-def memoize(fn):
-    """Memoize fn: make it remember the computed value for any argument list"""
-    def memoized_fn(*args):
-        if not args in memoized_fn.cache:
-            memoized_fn.cache[args] = fn(*args)
-        return memoized_fn.cache[args]
-    memoized_fn.cache = {}
+def memoize(fn, slot=None):
+    """Memoize fn: make it remember the computed value for any argument list.
+    If slot is specified, store result in that slot of first argument.
+    If slot is false, store results in a dictionary."""
+    if slot:
+        def memoized_fn(obj, *args):
+            if hasattr(obj, slot):
+                return getattr(obj, slot)
+            else:
+                val = fn(obj, *args)
+                setattr(obj, slot, val)
+                return val
+    else:
+        def memoized_fn(*args):
+            if not args in memoized_fn.cache:
+                memoized_fn.cache[args] = fn(*args)
+            return memoized_fn.cache[args]
+        memoized_fn.cache = {}
     return memoized_fn
 
 def update(x, **entries):
@@ -52,59 +63,577 @@ class Queue:
     def extend(self, items):
         for item in items: self.append(item)
 
-def LIFOQueue():
+import collections # for dequeue
+class LIFOQueue(list):
     """
-    Return an empty list, suitable as a Last-In-First-Out Queue.
-    Last-In-First-Out Queues are also called stacks
+    A Last-In-First-Out Queue, also called a stack.
+    Keeps a count of the queued items alongside the list so that
+    'item in q' does not have to scan the whole stack.
     """
-    return []
+    def __init__(self):
+        list.__init__(self)
+        self.index = collections.Counter()
+    def append(self, item):
+        list.append(self, item)
+        self.index[item] += 1
+    def extend(self, items):
+        for item in items: self.append(item)
+    def pop(self):
+        item = list.pop(self)
+        _discard(self.index, item)
+        return item
+    def __contains__(self, item):
+        return item in self.index
 
 
-import collections # for dequeue
 class FIFOQueue(collections.deque):
     """
     A First-In-First-Out Queue.
+    Keeps a count of the queued items alongside the deque so that
+    'item in q' is a hash lookup instead of a scan of the deque.
     """
     def __init__(self):
         collections.deque.__init__(self)
+        self.index = collections.Counter()
+    def append(self, item):
+        collections.deque.append(self, item)
+        self.index[item] += 1
+    def extend(self, items):
+        for item in items: self.append(item)
     def pop(self):
-        return self.popleft()
+        item = self.popleft()
+        _discard(self.index, item)
+        return item
+    def __contains__(self, item):
+        return item in self.index
+
+
+class IndexFIFO(collections.deque):
+    """
+    A First-In-First-Out Queue without the membership index of FIFOQueue,
+    for the NodeStore indices of graph_search, which tracks the queued
+    states itself. A plain list is the LIFO counterpart.
+    """
+    pop = collections.deque.popleft
+
+
+def _discard(index, item):
+    "Decrement the count of item in index, dropping the key when it hits zero."
+    if index[item] > 1:
+        index[item] -= 1
+    else:
+        del index[item]
 
 
 import heapq
 class PriorityQueue(Queue):
     """
     A queue in which the minimum  element (as determined by f) is returned first.
-    The item with minimum f(x) is returned first
+    The item with minimum f(x) is returned first.
+    A dict maps each queued item to its heap entry, so membership, lookup
+    and deletion do not scan the heap. Deleted (or replaced) entries are
+    only marked as removed and are skipped when they reach the top of the heap.
+    Appending an item equal to one already queued replaces the old entry.
     """
+    REMOVED = object() # placeholder for an invalidated heap entry
+
     def __init__(self, f=lambda x: x):
-        self.A = []  # list of pairs  (f(item), item)
+        self.A = []  # heap of entries [f(item), count, item]
+        self.index = {} # item -> its live entry in self.A
         self.f = f
         self.counter = itertools.count() # unique sequence count
     def append(self, item):
-        # thw pair  (f(item), item)  is pushed on the internal heapq
-        heapq.heappush(self.A, (self.f(item), next(self.counter), item))
+        # the entry [f(item), count, item] is pushed on the internal heapq
+        if item in self.index:
+            self.index.pop(item)[2] = self.REMOVED
+        entry = [self.f(item), next(self.counter), item]
+        self.index[item] = entry
+        heapq.heappush(self.A, entry)
     def __len__(self):
-        return len(self.A)
+        return len(self.index)
     def __str__(self):
-        return str(self.A)
+        return str([entry for entry in self.A if entry[2] is not self.REMOVED])
     def pop(self):
-        return heapq.heappop(self.A)[2]
-        # (self.f(item), item) is returned by heappop
-        # (self.f(item), item)[1]   is item
+        while self.A:
+            item = heapq.heappop(self.A)[2]
+            # [f(item), count, item] is returned by heappop
+            if item is not self.REMOVED:
+                del self.index[item]
+                return item
+        raise IndexError('pop from an empty priority queue')
     def __contains__(self, item):
-        # Note that on the next line a generator is used!
-        # the _ corresponds to f(x)
-        return any(x==item for _,_, x in self.A)
+        return item in self.index
+    def __iter__(self):
+        return (entry[2] for entry in self.A if entry[2] is not self.REMOVED)
     def __getitem__(self, key):
-        for _,_, item in self.A:
-            if item == key:
-                return item
+        entry = self.index.get(key)
+        if entry is not None:
+            return entry[2]
     def __delitem__(self, key):
-        for i, (value,count,item) in enumerate(self.A):
-            if item == key:
-                self.A.pop(i)
-                return
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            entry[2] = self.REMOVED
+#______________________________________________________________________________
+# Explored sets and search statistics
+
+import bisect
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+
+class SearchStats:
+    """
+    Statistics of a search. The search drivers fill in the SearchStats
+    given as their stats argument (or a new one) and attach it to the goal
+    node they return, as node.stats.
+        expanded     -- nodes expanded
+        generated    -- child nodes generated
+        duplicates   -- children dropped as already explored or queued
+        max_frontier -- largest size of the frontier
+        explored     -- size of the explored set at the end
+        seconds      -- wall time of the search
+        peak_memory  -- peak resident memory of the process, in bytes
+        spills       -- times the explored set was spilled to disk
+        spilled      -- states whose hash is on disk
+    With timing=True, the seconds spent in the actions, result and
+    goal_test methods of the problem and in the f (or heuristic) function
+    are added up in time_actions, time_result, time_goal_test and
+    time_heuristic. Timing every call slows the search down a little, so
+    it is off by default.
+    """
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.expanded = self.generated = self.duplicates = 0
+        self.max_frontier = self.explored = 0
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self.spills = 0
+        self.spilled = 0
+        if timing:
+            self.time_actions = self.time_result = 0.0
+            self.time_goal_test = self.time_heuristic = 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.expanded / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return '<SearchStats %s>' % ', '.join('%s=%s' % item for item in sorted(vars(self).items()))
+
+
+def _timed(fn, stats, counter):
+    "fn, adding the time spent in it to the counter attribute of stats if timing."
+    if not stats.timing:
+        return fn
+    clock = time.perf_counter
+    def timed_fn(*args):
+        start = clock()
+        try:
+            return fn(*args)
+        finally:
+            setattr(stats, counter, getattr(stats, counter) + clock() - start)
+    return timed_fn
+
+
+class LimitReached:
+    """
+    What a search returns instead of a goal node (or None) when it stops
+    before the end, on one of its limits:
+        reason -- 'time' (time_limit seconds passed), 'nodes' (node_limit
+                  nodes expanded) or 'cancelled' (the cancel event was set)
+        stats  -- the SearchStats of the search so far
+    It is false, like None, so 'if not result' still tells there is no
+    solution; check isinstance(result, LimitReached) to know why.
+    """
+    def __init__(self, reason, stats):
+        self.reason, self.stats = reason, stats
+
+    def __bool__(self):
+        return False
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<LimitReached %s after %d nodes>' % (self.reason, self.stats.expanded)
+
+
+class _Monitor:
+    """
+    Counts the nodes expanded and the largest frontier of a search, calls
+    progress(stats) every interval seconds if progress is given, and
+    checks the limits of the search:
+        time_limit -- seconds the search may run, or None
+        node_limit -- nodes it may expand, or None
+        cancel     -- a threading.Event (or anything with an is_set
+                      method, like a multiprocessing.Event), or None;
+                      the search stops once it is set
+    The clock and the cancel event are only looked at every 256 nodes.
+    """
+
+    def __init__(self, stats, progress=None, interval=1.0,
+                 time_limit=None, node_limit=None, cancel=None):
+        self.stats, self.progress, self.interval = stats, progress, interval
+        self.start = time.perf_counter()
+        self.next_report = self.start + interval
+        self.deadline = float('inf') if time_limit is None else self.start + time_limit
+        self.node_limit = float('inf') if node_limit is None else stats.expanded + node_limit
+        self.cancel = cancel
+        self.watching = progress or cancel is not None or time_limit is not None
+
+    def tick(self, frontier=()):
+        """A node is about to be expanded, with frontier left. Return the
+        reason to stop the search instead (see LimitReached), or None."""
+        stats = self.stats
+        if stats.expanded >= self.node_limit:
+            return 'nodes'
+        if self.watching and not stats.expanded & 0xFF:
+            reason = self.check()
+            if reason:
+                return reason
+        stats.expanded += 1
+        if len(frontier) > stats.max_frontier:
+            stats.max_frontier = len(frontier)
+        return None
+
+    def check(self):
+        "Report progress if it is time to, and return the reason to stop, or None."
+        if self.cancel is not None and self.cancel.is_set():
+            return 'cancelled'
+        now = time.perf_counter()
+        if now >= self.deadline:
+            return 'time'
+        if self.progress and now >= self.next_report:
+            self.stats.seconds = now - self.start
+            self.progress(self.stats)
+            self.next_report = now + self.interval
+        return None
+
+    def done(self, explored=None):
+        "The search is over."
+        self.stats.seconds = time.perf_counter() - self.start
+        if explored is not None:
+            self.stats.explored = len(explored)
+
+
+class _Stop(Exception):
+    "Raised to unwind a recursive search stopped on a limit."
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
+        self.reason = reason
+
+
+def peak_memory():
+    "Return the peak resident memory of this process in bytes, or 0 if unknown."
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # kB on Linux
+
+
+def _sizeof(obj, seen=None):
+    "Rough size in bytes of obj and the objects it holds."
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in obj.items())
+    else:
+        size += sum(_sizeof(getattr(obj, slot), seen)
+                    for slot in getattr(type(obj), '__slots__', ()) if hasattr(obj, slot))
+        if hasattr(obj, '__dict__'):
+            size += _sizeof(obj.__dict__, seen)
+    return size
+
+
+class SpillingSet:
+    """
+    A set of states, the explored set of a graph search, kept within an
+    estimated memory budget in bytes. The size of a state is estimated from
+    the first one added. When the states held in memory reach the budget,
+    their 64 bit hashes are sorted and written to a new run file on disk,
+    and the states are dropped from memory. Membership is then checked in
+    memory first, then by bisection in the memory mapped runs, so two
+    states with the same 64 bit hash are taken to be the same (very
+    unlikely). Runs are merged into one when there are more than max_runs.
+    Call close() to delete the run files.
+    """
+    ENTRY_BYTES = 64 # hash table slot and reference, on top of the state
+
+    def __init__(self, memory_budget, directory=None, max_runs=8):
+        self.memory_budget = memory_budget
+        self.capacity = None # states that fit in the budget
+        self.states = set()
+        self.directory = tempfile.mkdtemp(prefix='explored-', dir=directory)
+        self.runs = [] # [path, file, mmap, memoryview of unsigned 64 bit ints]
+        self.max_runs = max_runs
+        self.spills = self.spilled = 0
+        self.count = itertools.count()
+
+    @staticmethod
+    def key(state):
+        return hash(state) & 0xFFFFFFFFFFFFFFFF
+
+    def add(self, state):
+        if self.capacity is None:
+            self.capacity = max(1, self.memory_budget // (_sizeof(state) + self.ENTRY_BYTES))
+        self.states.add(state)
+        if len(self.states) >= self.capacity:
+            self.spill()
+
+    def __contains__(self, state):
+        if state in self.states:
+            return True
+        key = self.key(state)
+        for run in self.runs:
+            view = run[3]
+            i = bisect.bisect_left(view, key)
+            if i < len(view) and view[i] == key:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.states) + self.spilled
+
+    def spill(self):
+        "Write the hashes of the states in memory to a new sorted run."
+        self.add_keys(array('Q', sorted(set(self.key(state) for state in self.states))))
+        self.states = set()
+        self.spills += 1
+
+    def keys(self):
+        "Iterate over the sorted hashes of the states on disk."
+        return heapq.merge(*[run[3] for run in self.runs])
+
+    def add_keys(self, keys):
+        "Add a sorted array('Q') of state hashes as a new run."
+        self.spilled += len(keys)
+        path = os.path.join(self.directory, 'run%d' % next(self.count))
+        with open(path, 'wb') as f:
+            keys.tofile(f)
+        self.runs.append(self._open(path))
+        if len(self.runs) > self.max_runs:
+            self._merge()
+
+    def _open(self, path):
+        f = open(path, 'rb')
+        if os.path.getsize(path) == 0:
+            return [path, f, None, memoryview(b'').cast('Q')]
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return [path, f, mapped, memoryview(mapped).cast('Q')]
+
+    def _close(self, run):
+        path, f, mapped, view = run
+        view.release()
+        if mapped is not None:
+            mapped.close()
+        f.close()
+        os.remove(path)
+
+    def _merge(self):
+        "Merge all the runs into one, a block at a time."
+        path = os.path.join(self.directory, 'run%d' % next(self.count))
+        with open(path, 'wb') as f:
+            block, last = array('Q'), None
+            for key in heapq.merge(*[run[3] for run in self.runs]):
+                if key != last:
+                    block.append(key)
+                    last = key
+                if len(block) >= 65536:
+                    block.tofile(f)
+                    del block[:]
+            block.tofile(f)
+        for run in self.runs:
+            self._close(run)
+        self.runs = [self._open(path)]
+
+    def close(self):
+        for run in self.runs:
+            self._close(run)
+        self.runs = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _explored_set(memory_budget):
+    "An empty explored set, spilling to disk beyond memory_budget bytes if given."
+    return set() if memory_budget is None else SpillingSet(memory_budget)
+
+
+def _finish_search(stats, explored, monitor):
+    "Fill in stats at the end of a graph search, and close the explored set."
+    monitor.done(explored)
+    stats.peak_memory = peak_memory()
+    if isinstance(explored, SpillingSet):
+        stats.spills, stats.spilled = explored.spills, explored.spilled
+        explored.close()
+
+
+def _found(node, stats, checkpointer=None):
+    """The search is over: attach the search statistics to the goal node
+    (if any), and drop the checkpoint."""
+    if checkpointer:
+        checkpointer.done()
+    if node is not None:
+        node.stats = stats
+    return node
+
+def _stopped(reason, stats, checkpointer=None, *search):
+    """The search stopped on a limit: save the checkpoint (if any) of the
+    store, frontier and explored set of the search, so it can be resumed
+    from there, and return the LimitReached."""
+    if checkpointer:
+        checkpointer.save(*search)
+    return LimitReached(reason, stats)
+
+#______________________________________________________________________________
+# Checkpoints of graph searches
+
+import struct
+
+CHECKPOINT_MAGIC = b'SRCHCKP2'
+IDA_CHECKPOINT_MAGIC = b'IDACKPT1'
+
+def _write_array(f, values):
+    f.write(struct.pack('<cQ', values.typecode.encode(), len(values)))
+    values.tofile(f)
+
+def _read_array(f):
+    typecode, length = struct.unpack('<cQ', f.read(9))
+    values = array(typecode.decode())
+    values.fromfile(f, length)
+    return values
+
+def _write_blobs(f, blobs):
+    _write_array(f, array('I', [len(blob) for blob in blobs]))
+    f.write(b''.join(blobs))
+
+def _read_blobs(f):
+    lengths = _read_array(f)
+    data = f.read(sum(lengths))
+    blobs, offset = [], 0
+    for length in lengths:
+        blobs.append(data[offset:offset+length])
+        offset += length
+    return blobs
+
+def save_checkpoint(path, problem, store, frontier, explored):
+    """
+    Write the state of a graph search to the file path: the columns of its
+    NodeStore, the states the store still holds (those of the roots and the
+    frontier), the frontier as node indices, and the explored set. States
+    and actions are stored with the encode_state and encode_action methods
+    of problem, and the hashes of the states spilled by a SpillingSet as
+    they are. The file is replaced atomically, so an interruption leaves
+    the previous checkpoint intact.
+    """
+    held = [i for i, state in enumerate(store.states) if state is not None]
+    if isinstance(explored, SpillingSet):
+        explored_states, keys = explored.states, array('Q', explored.keys())
+    else:
+        explored_states, keys = explored, array('Q')
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(CHECKPOINT_MAGIC)
+        _write_array(f, array('q', [-1 if action is None else problem.encode_action(action)
+                                    for action in store.actions]))
+        for column in (store.parent, store.action, store.g, store.depth, store.f):
+            _write_array(f, column)
+        _write_array(f, array('q', held))
+        _write_blobs(f, [problem.encode_state(store.states[i]) for i in held])
+        _write_array(f, array('q', frontier))
+        _write_blobs(f, [problem.encode_state(state) for state in explored_states])
+        _write_array(f, keys)
+    os.replace(temporary, path)
+
+def load_checkpoint(path, problem, store=None):
+    """
+    Read a checkpoint written by save_checkpoint into store, an empty
+    NodeStore (a new one if not given).
+    Return
+        the store, the array of the frontier node indices (in frontier
+        order), the list of explored states, and the array('Q') of the
+        hashes of spilled explored states
+    """
+    store = NodeStore() if store is None else store
+    with open(path, 'rb') as f:
+        if f.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError('%s is not a search checkpoint' % path)
+        store.actions = [None if code < 0 else problem.decode_action(code)
+                         for code in _read_array(f)]
+        store.codes = dict((action, code) for code, action in enumerate(store.actions))
+        store.parent, store.action, store.g, store.depth, store.f = [_read_array(f) for _ in range(5)]
+        held = _read_array(f)
+        store.states = [None] * len(store.parent)
+        for i, data in zip(held, _read_blobs(f)):
+            store.states[i] = problem.decode_state(data)
+        order = _read_array(f)
+        explored = [problem.decode_state(data) for data in _read_blobs(f)]
+        keys = _read_array(f)
+    return store, order, explored, keys
+
+class _Checkpointer:
+    """Saves a graph search to a checkpoint file every interval seconds,
+    and restores it when resuming."""
+
+    def __init__(self, path, interval, problem):
+        self.path, self.interval, self.problem = path, interval, problem
+        self.next_save = time.time() + interval
+
+    def restore(self, store, frontier, queued, explored, memory_budget):
+        """Load the checkpoint into the empty store, frontier, queued dict
+        and explored set. Return the explored set, which becomes a
+        SpillingSet if the checkpoint holds spilled hashes."""
+        store, order, states, keys = load_checkpoint(self.path, self.problem, store)
+        if keys and not isinstance(explored, SpillingSet):
+            explored = SpillingSet(float('inf') if memory_budget is None else memory_budget)
+        if keys:
+            explored.add_keys(keys)
+        for state in states:
+            explored.add(state)
+        for i in order:
+            queued[store.states[i]] = i
+            frontier.append(i)
+        return explored
+
+    def tick(self, store, frontier, explored):
+        "Save a checkpoint if it is time to."
+        if time.time() >= self.next_save:
+            self.save(store, frontier, explored)
+
+    def save(self, store, frontier, explored):
+        "Save a checkpoint now."
+        save_checkpoint(self.path, self.problem, store, frontier, explored)
+        self.next_save = time.time() + self.interval
+
+    def done(self):
+        "The search is over, the checkpoint is not needed any more."
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _start_search(problem, store, frontier, queued, explored, memory_budget,
+                  checkpoint, interval, resume, f=None):
+    """Fill the store, frontier and queued dict with the root node (and
+    its f value if f is given), or with the nodes of the checkpoint if
+    resuming from one.
+    Return the explored set and the _Checkpointer (or None)."""
+    checkpointer = None if checkpoint is None else _Checkpointer(checkpoint, interval, problem)
+    if resume and checkpointer and os.path.exists(checkpoint):
+        explored = checkpointer.restore(store, frontier, queued, explored, memory_budget)
+    else:
+        root = store.add(problem.initial, f=f(_NodeView(problem.initial)) if f else 0)
+        queued[problem.initial] = root
+        frontier.append(root)
+    return explored, checkpointer
+
 #______________________________________________________________________________
 
 class Problem(object):
@@ -150,6 +679,24 @@ class Problem(object):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
         raise NotImplementedError
+
+    def encode_state(self, state):
+        """Return a compact bytes encoding of state, used by the search
+        checkpoints. decode_state must turn it back into the state."""
+        raise NotImplementedError
+
+    def decode_state(self, data):
+        "Return the state encoded as bytes by encode_state."
+        raise NotImplementedError
+
+    def encode_action(self, action):
+        """Return a non-negative integer encoding action, used by the
+        search checkpoints. decode_action must turn it back into the action."""
+        raise NotImplementedError
+
+    def decode_action(self, code):
+        "Return the action encoded by encode_action."
+        raise NotImplementedError
 #______________________________________________________________________________
 
 # Code to compare searchers on various problems.
@@ -184,6 +731,18 @@ class InstrumentedProblem(Problem):
     def value(self, state):
         return self.problem.value(state)
 
+    def encode_state(self, state):
+        return self.problem.encode_state(state)
+
+    def decode_state(self, data):
+        return self.problem.decode_state(data)
+
+    def encode_action(self, action):
+        return self.problem.encode_action(action)
+
+    def decode_action(self, code):
+        return self.problem.decode_action(code)
+
     def __getattr__(self, attr):
         return getattr(self.problem, attr)
 
@@ -258,147 +817,356 @@ class Node:
     def __hash__(self):
         return hash(self.state)
 
+#______________________________________________________________________________
+# Node store of the graph searches
+
+class NodeStore:
+    """
+    The nodes of a graph search, kept in parallel arrays instead of one Node
+    object each. A node is an index i into the columns
+        parent[i]  -- index of the parent node, -1 for a root
+        action[i]  -- code of the action from the parent, an index in actions
+        g[i]       -- path cost from the root
+        depth[i]   -- number of actions from the root
+        f[i]       -- f value of best_first_graph_search
+        states[i]  -- the state, until release(i) drops it
+    The g and f columns hold integers until a value that is not an int is
+    added, and doubles from then on, so path costs come back with the type
+    problem.path_cost gave them.
+    A node costs a few tens of bytes, and only the frontier nodes (and the
+    roots) hold their state: path and solution walk the parent indices, and
+    node rebuilds the Node objects of a path by replaying its actions from
+    the root with problem.result.
+    """
+
+    def __init__(self):
+        self.parent = array('q')
+        self.action = array('i')
+        self.g = array('q')
+        self.depth = array('i')
+        self.f = array('q')
+        self.states = []
+        self.actions = [] # code -> action
+        self.codes = {}   # action -> code
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, state, parent=-1, action=None, g=0, f=0):
+        "Add a node, the child of node parent by action. Return its index."
+        code = self.codes.get(action)
+        if code is None:
+            code = self.codes[action] = len(self.actions)
+            self.actions.append(action)
+        if self.g.typecode == 'q' and not isinstance(g, int):
+            self.g = array('d', self.g)
+        if self.f.typecode == 'q' and not isinstance(f, int):
+            self.f = array('d', self.f)
+        self.parent.append(parent)
+        self.action.append(code)
+        self.g.append(g)
+        self.depth.append(0 if parent < 0 else self.depth[parent] + 1)
+        self.f.append(f)
+        self.states.append(state)
+        return len(self.parent) - 1
+
+    def release(self, i):
+        "Return the state of node i, and drop it from the store unless i is a root."
+        state = self.states[i]
+        if self.parent[i] >= 0:
+            self.states[i] = None
+        return state
+
+    def path(self, i):
+        "Return the list of the node indices from the root to node i."
+        path_back = []
+        while i >= 0:
+            path_back.append(i)
+            i = self.parent[i]
+        return list(reversed(path_back))
+
+    def solution(self, i):
+        "Return the sequence of actions to go from the root to node i."
+        return [self.actions[self.action[j]] for j in self.path(i)[1:]]
+
+    def node(self, problem, i):
+        """Return the Node of node i, with its chain of parents, replaying
+        the actions from the root. The f values are set on the nodes."""
+        path = self.path(i)
+        node = Node(self.states[path[0]])
+        node.f = self.f[path[0]]
+        for j in path[1:]:
+            action = self.actions[self.action[j]]
+            node = Node(problem.result(node.state, action), node, action, self.g[j])
+            node.f = self.f[j]
+        return node
+
+
+class _NodeView:
+    """What the f function of best_first_graph_search is given for a
+    child, before the child gets into the NodeStore: its state, action,
+    path_cost and depth."""
+    __slots__ = ('state', 'action', 'path_cost', 'depth')
+
+    def __init__(self, state, action=None, path_cost=0, depth=0):
+        self.state, self.action, self.path_cost, self.depth = state, action, path_cost, depth
+
 #______________________________________________________________________________
 
 # Uninformed Search algorithms
 
-def tree_search(problem, frontier):
+def tree_search(problem, frontier, stats=None, progress=None, progress_interval=1.0,
+                time_limit=None, node_limit=None, cancel=None):
     """
         Search through the successors of a problem to find a goal.
         The argument frontier should be an empty queue.
         Don't worry about repeated paths to a state. [Fig. 3.7]
+        The statistics of the search are gathered in stats, a SearchStats
+        (a new one if not given), which is attached to the goal node. If
+        progress is given, progress(stats) is called every
+        progress_interval seconds.
+        The search stops after time_limit seconds, node_limit nodes
+        expanded, or once the cancel event is set (see _Monitor).
         Return
              the node of the first goal state found
              or None is no goal state is found
+             or a LimitReached if the search stopped on a limit
     """
     assert isinstance(problem, Problem)
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, progress, progress_interval, time_limit, node_limit, cancel)
+    actions = _timed(problem.actions, stats, 'time_actions')
+    result = _timed(problem.result, stats, 'time_result')
+    goal_test = _timed(problem.goal_test, stats, 'time_goal_test')
     frontier.append(Node(problem.initial))
-    while frontier:
-        node = frontier.pop()
-        if problem.goal_test(node.state):
-            return node
-        frontier.extend(node.expand(problem))
-    return None
-
-def graph_search(problem, frontier):
+    try:
+        while frontier:
+            reason = monitor.tick(frontier)
+            if reason:
+                return _stopped(reason, stats)
+            node = frontier.pop()
+            if goal_test(node.state):
+                return _found(node, stats)
+            for action in actions(node.state):
+                child = result(node.state, action)
+                frontier.append(Node(child, node, action,
+                                     problem.path_cost(node.path_cost, node.state, action, child)))
+                stats.generated += 1
+        return None
+    finally:
+        monitor.done()
+        stats.peak_memory = peak_memory()
+
+def graph_search(problem, frontier, memory_budget=None, stats=None,
+                 checkpoint=None, checkpoint_interval=60, resume=False,
+                 progress=None, progress_interval=1.0,
+                 time_limit=None, node_limit=None, cancel=None):
     """
     Search through the successors of a problem to find a goal.
-    The argument frontier should be an empty queue.
+    The argument frontier should be an empty queue of node indices: a
+    list (LIFO) or an IndexFIFO, as membership is kept in a dict of the
+    queued states rather than by the queue.
     If two paths reach a state, only use the first one. [Fig. 3.7]
+    The nodes are kept in a NodeStore and the frontier holds their indices:
+    a child is only stored if its state is neither explored nor queued, and
+    the Node objects are only built for the path of the goal node returned.
+    If memory_budget (in bytes) is given, the explored set spills to disk
+    when it would grow beyond it, see SpillingSet.
+    The statistics of the search are gathered in stats, a SearchStats
+    (a new one if not given), which is attached to the goal node. If
+    progress is given, progress(stats) is called every progress_interval
+    seconds.
+    If checkpoint (a file path) is given, the search is saved there every
+    checkpoint_interval seconds (see save_checkpoint), and with resume it
+    starts again from that file if it exists. The file is removed when the
+    search is over.
+    The search stops after time_limit seconds, node_limit nodes expanded,
+    or once the cancel event is set (see _Monitor); the checkpoint, if
+    any, is then saved so that the search can be resumed.
     Return
         the node of the first goal state found
         or None is no goal state is found
+        or a LimitReached if the search stopped on a limit
     """
     assert isinstance(problem, Problem)
-    frontier.append(Node(problem.initial))
-    explored = set() # initial empty set of explored states
-    while frontier:
-        node = frontier.pop()
-        if problem.goal_test(node.state):
-            return node
-        explored.add(node.state)
-        # Python note: next line uses of a generator
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored
-                        and child not in frontier)
-    return None
-
-
-def breadth_first_tree_search(problem):
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, progress, progress_interval, time_limit, node_limit, cancel)
+    actions = _timed(problem.actions, stats, 'time_actions')
+    result = _timed(problem.result, stats, 'time_result')
+    goal_test = _timed(problem.goal_test, stats, 'time_goal_test')
+    store, queued = NodeStore(), {} # queued: state -> its node in the frontier
+    explored, checkpointer = _start_search(problem, store, frontier, queued,
+                                           _explored_set(memory_budget), memory_budget,
+                                           checkpoint, checkpoint_interval, resume)
+    try:
+        while frontier:
+            if checkpointer:
+                checkpointer.tick(store, frontier, explored)
+            reason = monitor.tick(frontier)
+            if reason:
+                return _stopped(reason, stats, checkpointer, store, frontier, explored)
+            i = frontier.pop()
+            state = store.release(i)
+            del queued[state]
+            if goal_test(state):
+                return _found(store.node(problem, i), stats, checkpointer)
+            explored.add(state)
+            g = store.g[i]
+            for action in actions(state):
+                child = result(state, action)
+                stats.generated += 1
+                if child in explored or child in queued:
+                    stats.duplicates += 1
+                    continue
+                queued[child] = j = store.add(child, i, action,
+                                              problem.path_cost(g, state, action, child))
+                frontier.append(j)
+        return _found(None, stats, checkpointer)
+    finally:
+        _finish_search(stats, explored, monitor)
+
+
+def breadth_first_tree_search(problem, **options):
     "Search the shallowest nodes in the search tree first."
-    return tree_search(problem, FIFOQueue())
+    return tree_search(problem, FIFOQueue(), **options)
 
 
-def depth_first_tree_search(problem):
+def depth_first_tree_search(problem, **options):
     "Search the deepest nodes in the search tree first."
-    return tree_search(problem, LIFOQueue())
+    return tree_search(problem, LIFOQueue(), **options)
 
 
-def depth_first_graph_search(problem):
+def depth_first_graph_search(problem, **options):
     "Search the deepest nodes in the search tree first."
-    return graph_search(problem, LIFOQueue())
+    return graph_search(problem, [], **options)
 
 
-def breadth_first_graph_search(problem):
+def breadth_first_graph_search(problem, **options):
     "Graph search version of BFS.  [Fig. 3.11]"
-    return graph_search(problem, FIFOQueue())
+    return graph_search(problem, IndexFIFO(), **options)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
-def best_first_tree_search(problem, f):
+def best_first_tree_search(problem, f, stats=None, time_limit=None, node_limit=None, cancel=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    The stats and limits are as in tree_search.
     """
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, time_limit=time_limit, node_limit=node_limit, cancel=cancel)
     node = Node(problem.initial)
     if problem.goal_test(node.state):
-        return node
+        return _found(node, stats)
     frontier = PriorityQueue(f)
     frontier.append(node)
-    while frontier:
-        node = frontier.pop()
-        if problem.goal_test(node.state):
-            return node
-        for child in node.expand(problem):
-            if child not in frontier:
-                frontier.append(child)
-            elif child in frontier:
-                incumbent = frontier[child] # incumbent is a node
-                if f(child) < f(incumbent):
-                    del frontier[incumbent]
+    try:
+        while frontier:
+            reason = monitor.tick(frontier)
+            if reason:
+                return _stopped(reason, stats)
+            node = frontier.pop()
+            if problem.goal_test(node.state):
+                return _found(node, stats)
+            for child in node.expand(problem):
+                stats.generated += 1
+                if child not in frontier:
                     frontier.append(child)
-    return None
+                elif child in frontier:
+                    incumbent = frontier[child] # incumbent is a node
+                    if f(child) < f(incumbent):
+                        del frontier[incumbent]
+                        frontier.append(child)
+        return None
+    finally:
+        monitor.done()
 
 
 
-def best_first_graph_search(problem, f):
+def best_first_graph_search(problem, f, memory_budget=None, stats=None,
+                            checkpoint=None, checkpoint_interval=60, resume=False,
+                            progress=None, progress_interval=1.0,
+                            time_limit=None, node_limit=None, cancel=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
-    There is a subtlety: the line "f = memoize(f, 'f')" means that the f
-    values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned.
+    The f values of the nodes are kept in the NodeStore, and set on the
+    nodes of the path returned, so after doing a best first search you can
+    examine them. f is given the state, action, path_cost and depth of a
+    child (see _NodeView) before the child is stored.
+    The other arguments are as in graph_search.
     """
-    f = memoize(f)
-    node = Node(problem.initial)
-    if problem.goal_test(node.state):
-        return node
-    frontier = PriorityQueue(f)
-    frontier.append(node)
-    explored = set()
-    while frontier:
-        node = frontier.pop()
-        if problem.goal_test(node.state):
-            return node
-        explored.add(node.state)
-        for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
-                frontier.append(child)
-            elif child in frontier:
-                incumbent = frontier[child] # incumbent is a node
-                if f(child) < f(incumbent):
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, progress, progress_interval, time_limit, node_limit, cancel)
+    actions = _timed(problem.actions, stats, 'time_actions')
+    result = _timed(problem.result, stats, 'time_result')
+    goal_test = _timed(problem.goal_test, stats, 'time_goal_test')
+    f = _timed(f, stats, 'time_heuristic')
+    store, queued = NodeStore(), {} # queued: state -> its node in the frontier
+    frontier = PriorityQueue(lambda i: store.f[i])
+    explored, checkpointer = _start_search(problem, store, frontier, queued,
+                                           _explored_set(memory_budget), memory_budget,
+                                           checkpoint, checkpoint_interval, resume, f)
+    try:
+        while frontier:
+            if checkpointer:
+                checkpointer.tick(store, frontier, explored)
+            reason = monitor.tick(frontier)
+            if reason:
+                return _stopped(reason, stats, checkpointer, store, frontier, explored)
+            i = frontier.pop()
+            state = store.release(i)
+            del queued[state]
+            if goal_test(state):
+                return _found(store.node(problem, i), stats, checkpointer)
+            explored.add(state)
+            g, depth = store.g[i], store.depth[i] + 1
+            for action in actions(state):
+                child = result(state, action)
+                stats.generated += 1
+                if child in explored:
+                    stats.duplicates += 1
+                    continue
+                cost = problem.path_cost(g, state, action, child)
+                value = f(_NodeView(child, action, cost, depth))
+                incumbent = queued.get(child)
+                if incumbent is not None:
+                    if value >= store.f[incumbent]:
+                        stats.duplicates += 1
+                        continue
                     del frontier[incumbent]
-                    frontier.append(child)
-    return None
-
-def uniform_cost_search(problem):
+                    store.release(incumbent)
+                queued[child] = j = store.add(child, i, action, cost, value)
+                frontier.append(j)
+        return _found(None, stats, checkpointer)
+    finally:
+        _finish_search(stats, explored, monitor)
+
+def uniform_cost_search(problem, **options):
     "[Fig. 3.14]"
-    return best_first_graph_search(problem, lambda node: node.path_cost)
+    return best_first_graph_search(problem, lambda node: node.path_cost, **options)
 
-def depth_limited_search(problem, limit=50):
-    "[Fig. 3.17]"
+def depth_limited_search(problem, limit=50, stats=None, time_limit=None,
+                         node_limit=None, cancel=None, monitor=None):
+    """[Fig. 3.17]
+    The stats and limits are as in tree_search (or given by the monitor
+    of iterative_deepening_search)."""
     def recursive_dls(node, problem, limit):
         if problem.goal_test(node.state):
             return node
         elif node.depth == limit:
             return 'cutoff'
         else:
+            reason = monitor.tick()
+            if reason:
+                raise _Stop(reason)
             cutoff_occurred = False
             for child in node.expand(problem):
+                monitor.stats.generated += 1
                 result = recursive_dls(child, problem, limit)
                 if result == 'cutoff':
                     cutoff_occurred = True
@@ -410,14 +1178,118 @@ def depth_limited_search(problem, limit=50):
                 return None
 
     # Body of depth_limited_search:
-    return recursive_dls(Node(problem.initial), problem, limit)
+    own_monitor = monitor is None
+    if own_monitor:
+        stats = SearchStats() if stats is None else stats
+        monitor = _Monitor(stats, time_limit=time_limit, node_limit=node_limit, cancel=cancel)
+    try:
+        result = recursive_dls(Node(problem.initial), problem, limit)
+    except _Stop as stop:
+        return LimitReached(stop.reason, monitor.stats)
+    finally:
+        if own_monitor:
+            monitor.done()
+    if isinstance(result, Node):
+        _found(result, monitor.stats)
+    return result
+
+def iterative_deepening_search(problem, stats=None, time_limit=None, node_limit=None, cancel=None):
+    """[Fig. 3.18]
+    The stats and limits are as in tree_search, and span all the depths."""
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, time_limit=time_limit, node_limit=node_limit, cancel=cancel)
+    try:
+        for depth in itertools.count():
+            result = depth_limited_search(problem, depth, monitor=monitor)
+            if result != 'cutoff':
+                return result
+    finally:
+        monitor.done()
+
+def bidirectional_breadth_first_search(problem, reverse, stats=None, time_limit=None,
+                                       node_limit=None, cancel=None):
+    """
+    Breadth first search from both ends: forward from problem.initial
+    using problem, and backward from the goal states of problem, listed in
+    reverse.initial, using reverse.
+    The actions of reverse undo those of problem: reverse.invert(action)
+    is the action of problem going from reverse.result(state, action)
+    back to state.
+    The side with the smaller frontier expands a whole layer at a time, and
+    both sides share their visited states in hash tables. The search stops
+    on the layer where the two sides first meet, with the meeting state
+    giving the fewest steps.
+    The stats and limits are as in tree_search, the nodes of both sides
+    counting as expanded.
+    Return
+        the goal node of a path for problem (see Node.path),
+        or None if no goal state can be reached
+        or a LimitReached if the search stopped on a limit
+    """
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, time_limit=time_limit, node_limit=node_limit, cancel=cancel)
+    try:
+        return _bidirectional_search(problem, reverse, monitor)
+    except _Stop as stop:
+        return LimitReached(stop.reason, stats)
+    finally:
+        monitor.done()
+        stats.peak_memory = peak_memory()
+
+def _bidirectional_search(problem, reverse, monitor):
+    "The search of bidirectional_breadth_first_search, ticking the monitor."
+    start = Node(problem.initial)
+    forward = {start.state: start}
+    backward = {}
+    for state in reverse.initial:
+        backward[state] = Node(state)
+    if start.state in backward:
+        return _found(_join_paths(problem, reverse, start, backward[start.state]), monitor.stats)
+
+    forward_layer, backward_layer = [start], list(backward.values())
+    while forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            forward_layer, meeting = _expand_layer(problem, forward_layer, forward, backward, monitor)
+            if meeting:
+                return _found(_join_paths(problem, reverse, *meeting), monitor.stats)
+        else:
+            backward_layer, meeting = _expand_layer(reverse, backward_layer, backward, forward, monitor)
+            if meeting:
+                return _found(_join_paths(problem, reverse, *reversed(meeting)), monitor.stats)
+    return None
 
-def iterative_deepening_search(problem):
-    "[Fig. 3.18]"
-    for depth in itertools.count():
-        result = depth_limited_search(problem, depth)
-        if result != 'cutoff':
-            return result
+def _expand_layer(problem, layer, visited, other, monitor):
+    """Expand every node of layer, adding the new states to visited.
+    Return the next layer, and the (node, other node) pair with the fewest
+    steps among the new states also in other, or None.
+    Raise _Stop if the monitor tells the search to stop."""
+    next_layer, meeting = [], None
+    for node in layer:
+        reason = monitor.tick(layer)
+        if reason:
+            raise _Stop(reason)
+        for child in node.expand(problem):
+            monitor.stats.generated += 1
+            if child.state in visited:
+                monitor.stats.duplicates += 1
+                continue
+            visited[child.state] = child
+            next_layer.append(child)
+            if child.state in other:
+                incumbent = other[child.state]
+                if meeting is None or child.depth + incumbent.depth < meeting[0].depth + meeting[1].depth:
+                    meeting = (child, incumbent)
+    return next_layer, meeting
+
+def _join_paths(problem, reverse, node, back):
+    """Extend the forward node along the backward path of back, turning
+    each reverse action into the action of problem that undoes it."""
+    while back.parent:
+        action = reverse.invert(back.action)
+        state = back.parent.state
+        node = Node(state, node, action, problem.path_cost(node.path_cost, node.state, action, state))
+        back = back.parent
+    return node
 
 #______________________________________________________________________________
 # Informed (Heuristic) Search
@@ -425,20 +1297,356 @@ def iterative_deepening_search(problem):
 greedy_best_first_graph_search = best_first_graph_search
     # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
-def astar_graph_search(problem, h=None):
+def astar_graph_search(problem, h=None, **options):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
-    h = memoize(h or problem.h)
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n))
+    else in your Problem subclass. The options are those of
+    best_first_graph_search, which calls f (so h) once per child."""
+    h = h or problem.h
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), **options)
+
+
+def iterative_deepening_astar_search(problem, h=None, table_size=1000000,
+                                     checkpoint=None, resume=False, stats=None,
+                                     time_limit=None, node_limit=None, cancel=None):
+    """IDA*: repeated depth first searches, each cut off at nodes with
+    f(n) = g(n)+h(n) above a bound, which starts at h(initial) and grows to
+    the smallest f cut off by the previous iteration.
+    The depth first search keeps an explicit stack instead of recursing, so
+    memory is the depth of the search plus a transposition table of at
+    most table_size states, evicting the least recently used one. The table
+    keeps the h of each state, and the smallest g it was expanded with in
+    the current iteration, so revisiting it with no smaller g is skipped.
+    You need to specify the h function, or else in your Problem subclass.
+    If checkpoint (a file path) is given, the bound of each iteration is
+    saved there, and with resume the search starts again from the saved
+    bound. The file is removed when the search is over.
+    The stats and limits are as in tree_search; when the search stops on
+    a limit, the checkpoint is kept so that the iteration can be resumed.
+    Return
+        the node of the first goal state found
+        or None is no goal state can be reached
+        or a LimitReached if the search stopped on a limit"""
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, time_limit=time_limit, node_limit=node_limit, cancel=cancel)
+    try:
+        return _ida_search(problem, h or problem.h, table_size, checkpoint, resume, monitor)
+    finally:
+        monitor.done()
+        stats.peak_memory = peak_memory()
+
+def _ida_search(problem, h, table_size, checkpoint, resume, monitor):
+    "The search of iterative_deepening_astar_search, ticking the monitor."
+    table = collections.OrderedDict() # state -> [g, bound, h]
+    root = Node(problem.initial)
+    bound = h(root)
+    if checkpoint and resume and os.path.exists(checkpoint):
+        with open(checkpoint, 'rb') as f:
+            if f.read(len(IDA_CHECKPOINT_MAGIC)) != IDA_CHECKPOINT_MAGIC:
+                raise ValueError('%s is not an IDA* checkpoint' % checkpoint)
+            bound, = struct.unpack('<d', f.read(8))
+    while bound < float('inf'):
+        if checkpoint:
+            with open(checkpoint + '.tmp', 'wb') as f:
+                f.write(IDA_CHECKPOINT_MAGIC + struct.pack('<d', bound))
+            os.replace(checkpoint + '.tmp', checkpoint)
+        next_bound = float('inf')
+        stack = [iter([root])]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+            entry = table.get(node.state)
+            if entry is None:
+                entry = table[node.state] = [float('inf'), None, h(node)]
+                if len(table) > table_size:
+                    table.popitem(last=False)
+            else:
+                table.move_to_end(node.state)
+            f = node.path_cost + entry[2]
+            if f > bound:
+                next_bound = min(next_bound, f)
+                continue
+            if problem.goal_test(node.state):
+                if checkpoint and os.path.exists(checkpoint):
+                    os.remove(checkpoint)
+                return _found(node, monitor.stats)
+            if entry[1] == bound and entry[0] <= node.path_cost:
+                continue # already expanded this iteration, with no more cost
+            reason = monitor.tick(stack)
+            if reason:
+                return LimitReached(reason, monitor.stats)
+            entry[0], entry[1] = node.path_cost, bound
+            children = node.expand(problem)
+            monitor.stats.generated += len(children)
+            stack.append(iter(children))
+        bound = next_bound
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return None
 
 
-def astar_tree_search(problem, h=None):
+def astar_tree_search(problem, h=None, **options):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
+    else in your Problem subclass. The options are those of
+    best_first_tree_search."""
+    h = h or problem.h
+    return best_first_tree_search(problem, lambda n: n.path_cost + h(n), **options)
+
+#______________________________________________________________________________
+# Hash distributed A* (HDA*)
+
+import multiprocessing
+import queue
+
+# The slots of the shared counters of hash_distributed_astar_search: per
+# worker, its idle flag and its expanded, generated, duplicates and largest
+# open list counts; then the batches of states sent but not yet received,
+# and the flag telling the workers to stop.
+_HDA_IDLE, _HDA_EXPANDED, _HDA_GENERATED, _HDA_DUPLICATES, _HDA_OPEN = range(5)
+
+def hash_distributed_astar_search(problem, h=None, workers=None, batch_size=256,
+                                  stats=None, progress=None, progress_interval=1.0,
+                                  time_limit=None, node_limit=None, cancel=None):
+    """HDA*: A* over worker processes (default: one per core), each owning
+    the states whose hash(state) % workers is its number. A worker keeps
+    the open list and the best g of its states, expands them in f order,
+    and sends each child to its owner in batches of up to batch_size
+    through the owner's queue (the owner computes its h). The cost of the
+    best goal found so far is shared, and nodes with f at or above it are
+    not expanded.
+    The search ends when every worker is idle, with nothing left to expand
+    below that cost, and no batch is in transit: the workers and a count of
+    the batches in transit share one lock, so the search process sees them
+    all at once. The goal then has the optimal cost, as the goal of
+    astar_graph_search, for an admissible h (states reached again with a
+    smaller g are reopened); its path is traced back through the parent
+    of each state kept by its owner, and replayed from problem.initial.
+    The problem is unchanged, but its states are pickled between the
+    processes, and their hashes must be the same in every process: true
+    of the Zobrist hashes of SokobanState, and of any hash with the 'fork'
+    start method (used where available), whose workers also inherit the
+    problem and h rather than pickling them.
+    The stats, progress and limits are as in best_first_graph_search; the
+    node limit is checked every few milliseconds, so a few more nodes may
+    be expanded.
+    Return
+        the node of the goal state found, with the least cost
+        or None is no goal state can be reached
+        or a LimitReached if the search stopped on a limit"""
     h = h or problem.h
-    return best_first_tree_search(problem, lambda n: n.path_cost + h(n))
+    workers = workers or os.cpu_count() or 1
+    stats = SearchStats() if stats is None else stats
+    monitor = _Monitor(stats, progress, progress_interval, time_limit, node_limit, cancel)
+    start = stats.expanded
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    counters = context.Array('q', 5 * workers + 2) # see _HDA_IDLE
+    incumbent = context.Value('d', float('inf')) # cost of the best goal found
+    winner = context.Value('i', -1) # the worker that found it
+    inboxes = [context.Queue() for w in range(workers)]
+    replies = context.Queue()
+    owner = hash(problem.initial) % workers
+    for w in range(workers):
+        counters[5 * w + _HDA_IDLE] = int(w != owner)
+    processes = [context.Process(target=_hda_worker, daemon=True,
+                                 args=(problem, h, w, workers, batch_size, counters,
+                                       incumbent, winner, inboxes, replies))
+                 for w in range(workers)]
+    for process in processes:
+        process.start()
+
+    def reply():
+        while True:
+            try:
+                message = replies.get(timeout=1.0)
+            except queue.Empty:
+                if not all(process.is_alive() for process in processes):
+                    raise RuntimeError('an HDA* worker process died')
+                continue
+            if message[0] == 'error':
+                raise RuntimeError('HDA* worker failed:\n' + message[1])
+            return message[1:]
+
+    try:
+        reason = None
+        while True:
+            try: # only errors come in while searching
+                message = replies.get(timeout=0.005)
+                if message[0] == 'error':
+                    raise RuntimeError('HDA* worker failed:\n' + message[1])
+            except queue.Empty:
+                pass
+            with counters.get_lock():
+                over = counters[5 * workers] == 0 and all(
+                    counters[5 * w + _HDA_IDLE] for w in range(workers))
+            _hda_stats(stats, counters, workers, start)
+            if over:
+                break
+            reason = monitor.check() or (stats.expanded >= monitor.node_limit and 'nodes')
+            if reason:
+                return LimitReached(reason, stats)
+            if not all(process.is_alive() for process in processes):
+                raise RuntimeError('an HDA* worker process died')
+        if winner.value < 0:
+            return None
+        # trace the path of the goal back through the parents kept by the owners
+        inboxes[winner.value].put(('goal',))
+        state, = reply()
+        actions = []
+        while True:
+            inboxes[hash(state) % workers].put(('trace', state))
+            state, action = reply()
+            if state is None:
+                break
+            actions.append(action)
+        node = Node(problem.initial)
+        for action in reversed(actions):
+            node = node.child_node(problem, action)
+        return _found(node, stats)
+    finally:
+        counters[5 * workers + 1] = 1 # the batches still queued are dropped
+        for inbox in inboxes:
+            inbox.put(('finish',))
+        for process in processes:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+        _hda_stats(stats, counters, workers, start)
+        monitor.done()
+        stats.peak_memory = peak_memory()
+
+def _hda_stats(stats, counters, workers, start):
+    "Add up the counters of the HDA* workers in stats."
+    stats.expanded = start + sum(counters[5 * w + _HDA_EXPANDED] for w in range(workers))
+    stats.generated = sum(counters[5 * w + _HDA_GENERATED] for w in range(workers))
+    stats.duplicates = sum(counters[5 * w + _HDA_DUPLICATES] for w in range(workers))
+    stats.max_frontier = sum(counters[5 * w + _HDA_OPEN] for w in range(workers))
+
+def _hda_worker(problem, h, w, workers, batch_size, counters, incumbent, winner,
+                inboxes, replies):
+    """The worker w of hash_distributed_astar_search: expands its states,
+    until told to finish. Its messages are ('states', batch) of (state,
+    parent, action, g, depth) tuples, ('goal',) and ('trace', state)
+    answered on replies, and ('finish',)."""
+    try:
+        _hda_work(problem, h, w, workers, batch_size, counters, incumbent, winner,
+                  inboxes, replies)
+    except Exception:
+        import traceback
+        replies.put(('error', traceback.format_exc()))
+    finally:
+        for inbox in inboxes: # batches left at a stop are dropped
+            inbox.cancel_join_thread()
+
+def _hda_work(problem, h, w, workers, batch_size, counters, incumbent, winner,
+              inboxes, replies):
+    "The loop of _hda_worker: receive, expand a round of nodes, send."
+    lock, base, transit, stop = counters.get_lock(), 5 * w, 5 * workers, 5 * workers + 1
+    heap, counter = [], itertools.count()
+    best = {} # state -> [g, parent, action], of the states owned by w
+    outgoing = [[] for other in range(workers)]
+    inbox = inboxes[w]
+    expanded = generated = duplicates = largest = 0
+    goal = None
+    idle = bool(counters[base + _HDA_IDLE])
+
+    def receive(state, parent, action, g, depth):
+        # a state of w reached with cost g: queue it unless no better than before
+        entry = best.get(state)
+        if entry is not None and g >= entry[0]:
+            return False
+        f = g + h(_NodeView(state, action, g, depth))
+        if f == float('inf'):
+            return False
+        best[state] = [g, parent, action]
+        heapq.heappush(heap, (f, next(counter), state, g, depth))
+        return True
+
+    def flush(other):
+        with lock:
+            counters[transit] += 1
+        inboxes[other].put(('states', outgoing[other]))
+        outgoing[other] = []
+
+    if hash(problem.initial) % workers == w:
+        receive(problem.initial, None, None, 0, 0)
+
+    while True:
+        bound = incumbent.value
+        # the messages: wait for one if there is nothing to expand
+        working = heap and heap[0][0] < bound
+        messages = []
+        try:
+            messages.append(inbox.get(timeout=None if idle else 0.01) if not working
+                            else inbox.get_nowait())
+            while True:
+                messages.append(inbox.get_nowait())
+        except queue.Empty:
+            pass
+        for message in messages:
+            kind = message[0]
+            if kind == 'states':
+                if counters[stop]:
+                    continue
+                for item in message[1]:
+                    if not receive(*item):
+                        duplicates += 1
+                with lock:
+                    counters[base + _HDA_IDLE] = 0
+                    counters[transit] -= 1
+                idle = False
+            elif kind == 'goal':
+                replies.put(('goal', goal))
+            elif kind == 'trace':
+                g, parent, action = best[message[1]]
+                replies.put(('trace', parent, action))
+            elif kind == 'finish':
+                return
+
+        # expand a round of nodes, up to a batch
+        for n in range(0 if counters[stop] else batch_size):
+            if not heap or heap[0][0] >= bound:
+                break
+            f, _, state, g, depth = heapq.heappop(heap)
+            if g > best[state][0]:
+                continue # reached again with a smaller g since
+            if problem.goal_test(state):
+                with incumbent.get_lock():
+                    if g < incumbent.value:
+                        incumbent.value, winner.value = g, w
+                        goal = state
+                bound = incumbent.value
+                continue
+            expanded += 1
+            for action in problem.actions(state):
+                child = problem.result(state, action)
+                cost = problem.path_cost(g, state, action, child)
+                generated += 1
+                other = hash(child) % workers
+                if other == w:
+                    if not receive(child, state, action, cost, depth + 1):
+                        duplicates += 1
+                else:
+                    outgoing[other].append((child, state, action, cost, depth + 1))
+                    if len(outgoing[other]) >= batch_size:
+                        flush(other)
+        largest = max(largest, len(heap))
+        counters[base + _HDA_EXPANDED] = expanded
+        counters[base + _HDA_GENERATED] = generated
+        counters[base + _HDA_DUPLICATES] = duplicates
+        counters[base + _HDA_OPEN] = largest
+
+        # send the children of the round, and go idle if there is nothing left
+        for other in range(workers):
+            if outgoing[other]:
+                flush(other)
+        if not idle and not (heap and heap[0][0] < incumbent.value):
+            with lock:
+                counters[base + _HDA_IDLE] = 1
+            idle = True
 
 #______________________________________________________________________________
 #
@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+'''
+A local solving service: warehouses in, solutions out, over a socket.
+
+The service runs on asyncio and solves in the worker processes of a
+ProcessPoolExecutor (see batch.solve_file), so the event loop only moves
+messages. The protocol is JSON lines over a Unix socket, or TCP if the
+address is host:port. A request is an object with the warehouse text:
+
+	{"id": 1, "warehouse": "#####\\n#@$.#\\n#####", "method": "pushes", "timeout": 30}
+
+and gets two answers, tagged with its id: {"status": "accepted"} right
+away, then the result of batch.solve_file once it is done (or a status
+'timeout' after its own timeout). A connection can send many requests,
+their results stream back as they are done.
+
+Requests for the same canonical warehouse (cache.canonical: the same
+layout wherever it is on the board, rotated or reflected) and method are
+coalesced onto a single solve in flight, each getting the solution turned
+back into its own frame. A solve that no request waits for any more is
+cancelled.
+
+	python3 service.py --socket /tmp/sokoban.sock --jobs 4
+	python3 service.py --socket /tmp/sokoban.sock warehouses/warehouse_047.txt
+'''
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import stat
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+import cache
+import sokoban
+
+#default socket of the command line
+SOCKET = '/tmp/sokoban.sock'
+
+#the longest request line, in bytes
+MAX_REQUEST = 1 << 20
+
+def _solve(text, method, heuristic, timeout, cancel):
+	#runs in a worker process
+	result = batch.solve_file('<service>', method, heuristic, timeout=timeout,
+		lines=text.split('\n'), cancel=cancel)
+	del result['file']
+	return result
+
+def _letters(transform):
+	#the LURD letters of the canonical frame of transform back in the warehouse frame
+	back = dict((new[0], old[0]) for old, new in cache.action_map(transform).items())
+	back.update((new.lower(), old.lower()) for new, old in list(back.items()))
+	return back
+
+class _Solve:
+	#a solve in flight, with the number of requests waiting for it
+	def __init__(self, future, cancel):
+		self.future, self.cancel = future, cancel
+		self.waiting = 0
+
+class SolvingService:
+	'''
+	Solves warehouses over a pool of 'jobs' worker processes (default: one
+	per core), coalescing the requests of the same canonical warehouse.
+	A solve is given up after solve_timeout seconds, whatever the timeouts
+	of its requests.
+	Counts self.requests, self.solves (started) and self.coalesced
+	(requests served by a solve already in flight).
+	'''
+
+	def __init__(self, jobs = None, solve_timeout = 300):
+		self.jobs = jobs
+		self.solve_timeout = solve_timeout
+		self.requests = self.solves = self.coalesced = 0
+		self._pool = self._manager = self._server = None
+		self._in_flight = {} #key -> _Solve
+		self._writers = set() #of the open connections
+
+	async def start(self, address = SOCKET):
+		'''
+		Start the pool and listen on address, a Unix socket path or
+		'host:port'.
+		'''
+		self._pool = ProcessPoolExecutor(max_workers = self.jobs)
+		self._manager = multiprocessing.Manager() #the cancel events of the solves
+		host, colon, port = address.rpartition(':')
+		if colon and port.isdigit():
+			self._server = await asyncio.start_server(self.handle, host or None, int(port),
+				limit = MAX_REQUEST)
+		else:
+			if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+				os.remove(address) #left by a service that is gone
+			self._server = await asyncio.start_unix_server(self.handle, address,
+				limit = MAX_REQUEST)
+		return self._server
+
+	async def close(self):
+		'''
+		Stop listening, cancel the solves in flight and shut the pool down.
+		'''
+		if self._server is not None:
+			self._server.close()
+			for writer in list(self._writers):
+				writer.close()
+			await self._server.wait_closed()
+		for entry in list(self._in_flight.values()):
+			entry.cancel.set()
+			entry.future.cancel()
+		if self._pool is not None:
+			await asyncio.get_running_loop().run_in_executor(None, self._pool.shutdown)
+		if self._manager is not None:
+			self._manager.shutdown()
+		self._pool = self._manager = self._server = None
+
+	async def solve(self, text, method = 'pushes', heuristic = 'matching', timeout = None):
+		'''
+		Solve the warehouse given as text, waiting at most timeout seconds
+		(or solve_timeout).
+
+		@return
+		    the result dict of batch.solve_file (without the file), with
+		    'coalesced' True if it came from a solve already in flight
+		'''
+		if method not in batch.METHODS:
+			raise ValueError('unknown method {0!r}, expected one of {1}'.format(method, batch.METHODS))
+		warehouse = sokoban.Warehouse()
+		warehouse.extract_locations(text.split('\n'))
+		canonical, transform = cache.canonical(warehouse)
+		key = (canonical, method, heuristic)
+		self.requests += 1
+
+		entry = self._in_flight.get(key)
+		coalesced = entry is not None
+		if coalesced:
+			self.coalesced += 1
+		else:
+			self.solves += 1
+			cancel = self._manager.Event()
+			future = asyncio.get_running_loop().run_in_executor(self._pool, _solve,
+				canonical, method, heuristic, self.solve_timeout, cancel)
+			entry = self._in_flight[key] = _Solve(future, cancel)
+			def finished(future):
+				if self._in_flight.get(key) is entry:
+					del self._in_flight[key]
+			future.add_done_callback(finished)
+
+		if timeout is None or timeout > self.solve_timeout:
+			timeout = self.solve_timeout
+		entry.waiting += 1
+		try:
+			result = dict(await asyncio.wait_for(asyncio.shield(entry.future), timeout))
+		except asyncio.TimeoutError:
+			result = dict(method = method, status = 'timeout')
+		finally:
+			entry.waiting -= 1
+			if not entry.waiting and not entry.future.done():
+				#nobody waits for it any more
+				entry.cancel.set()
+				entry.future.cancel()
+				if self._in_flight.get(key) is entry:
+					del self._in_flight[key]
+		if result.get('solution'):
+			letters = _letters(transform)
+			result['solution'] = ''.join(letters[move] for move in result['solution'])
+		result['coalesced'] = coalesced
+		return result
+
+	async def handle(self, reader, writer):
+		'''
+		Serve the requests of a connection, see the module documentation.
+		'''
+		tasks = set()
+		self._writers.add(writer)
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				if line.strip():
+					tasks.add(asyncio.ensure_future(self._request(line, writer)))
+					tasks = set(task for task in tasks if not task.done())
+			if tasks:
+				await asyncio.wait(tasks)
+		except (ConnectionError, ValueError): #lost, or a request line over MAX_REQUEST
+			pass
+		finally:
+			for task in tasks:
+				task.cancel()
+			self._writers.discard(writer)
+			writer.close()
+
+	async def _request(self, line, writer):
+		#answer one request line of a connection
+		answer = dict(id = None)
+		try:
+			request = json.loads(line)
+			answer['id'] = request.get('id')
+			self._send(writer, dict(answer, status = 'accepted'))
+			answer.update(await self.solve(request['warehouse'], request.get('method', 'pushes'),
+				request.get('heuristic', 'matching'), request.get('timeout')))
+		except asyncio.CancelledError:
+			raise
+		except (KeyError, ValueError, TypeError, AttributeError, AssertionError) as error:
+			answer.update(status = 'error', error = '{0}: {1}'.format(type(error).__name__, error))
+		self._send(writer, answer)
+
+	def _send(self, writer, message):
+		if not writer.is_closing():
+			writer.write(json.dumps(message).encode() + b'\n')
+
+def _connect(address):
+	host, colon, port = address.rpartition(':')
+	if colon and port.isdigit():
+		return asyncio.open_connection(host or None, int(port), limit = MAX_REQUEST)
+	return asyncio.open_unix_connection(address, limit = MAX_REQUEST)
+
+async def request(address, warehouses, **options):
+	'''
+	A client of the service at address: send the warehouses (texts) in a
+	single connection and yield the answers as they come, until each
+	warehouse has its result. The options (method, heuristic, timeout) are
+	those of every request; the ids are the indices of the warehouses.
+	'''
+	reader, writer = await _connect(address)
+	try:
+		left = 0
+		for n, text in enumerate(warehouses):
+			writer.write(json.dumps(dict(options, id = n, warehouse = text)).encode() + b'\n')
+			left += 1
+		await writer.drain()
+		while left:
+			line = await reader.readline()
+			if not line:
+				raise ConnectionError('the service closed the connection')
+			answer = json.loads(line)
+			if answer['status'] != 'accepted':
+				left -= 1
+			yield answer
+	finally:
+		writer.close()
+
+async def _serve(address, jobs, solve_timeout):
+	service = SolvingService(jobs, solve_timeout)
+	server = await service.start(address)
+	print('serving on {0}'.format(address), file = sys.stderr, flush = True)
+	try:
+		await server.serve_forever()
+	finally:
+		await service.close()
+
+async def _client(address, files, options):
+	texts = []
+	for path in files:
+		with open(path) as f:
+			texts.append(f.read())
+	failures = 0
+	async for answer in request(address, texts, **options):
+		if answer['status'] != 'accepted':
+			answer['file'] = files[answer['id']]
+			failures += answer['status'] not in ('solved', 'impossible')
+		print(json.dumps(answer), flush = True)
+	return failures
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0].strip())
+	parser.add_argument('files', nargs = '*', help = 'warehouse files to send to the service (else serve)')
+	parser.add_argument('-s', '--socket', default = SOCKET, help = 'Unix socket path, or host:port (default: %(default)s)')
+	parser.add_argument('-j', '--jobs', type = int, default = None, help = 'worker processes (default: one per core)')
+	parser.add_argument('-m', '--method', choices = batch.METHODS, default = 'pushes')
+	parser.add_argument('-t', '--timeout', type = float, default = None, help = 'seconds per request (client), or per solve (service, default: 300)')
+	args = parser.parse_args(argv)
+
+	if args.files:
+		options = dict(method = args.method)
+		if args.timeout is not None:
+			options['timeout'] = args.timeout
+		return 1 if asyncio.run(_client(args.socket, args.files, options)) else 0
+	try:
+		asyncio.run(_serve(args.socket, args.jobs, args.timeout or 300))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
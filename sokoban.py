@@ -3,7 +3,9 @@ from __future__ import division
 
 
 import operator
+import os
 import functools
+import hashlib
 '''
 
 This module defines utility functions and classes for sokoban
@@ -54,6 +56,71 @@ def find_2D_iterator(lines, char):
             yield (x,y)
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                           BOARD
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# The four elementary actions, in the order used by the Board tables
+ACTIONS = ('Up', 'Down', 'Left', 'Right')
+# (dx,dy) offset of each action
+DELTAS = ((0,-1), (0,1), (-1,0), (1,0))
+
+# Cell flags of Board.cells
+WALL = 1
+TARGET = 2
+
+class Board:
+    '''
+    The static part of a warehouse (walls and targets) compiled into a flat
+    array of cells. Cell (x,y) has index y*width+x.
+    self.cells is a bytearray of WALL/TARGET flags, one byte per cell.
+    self.targets is the sorted list of the target cells.
+    self.fingerprint is a hash of the walls and targets.
+    self.moves[d][i] is the cell next to cell i in direction ACTIONS[d],
+       or -1 if that cell is a wall or off the board.
+    self.pushes[d][i] is the cell two steps from cell i in direction
+       ACTIONS[d] (where a box pushed from cell i ends up), or -1 if
+       either step is blocked by a wall.
+    '''
+    def __init__(self, walls, targets):
+        X,Y = zip(*walls)
+        self.width, self.height = 1+max(X), 1+max(Y)
+        self.size = self.width*self.height
+        self.cells = bytearray(self.size)
+        for (x,y) in walls:
+            self.cells[self.index(x,y)] |= WALL
+        for (x,y) in targets:
+            self.cells[self.index(x,y)] |= TARGET
+        self.targets = sorted(self.index(x,y) for (x,y) in targets)
+        # identifies the layout of walls and targets, whatever the boxes
+        self.fingerprint = hashlib.sha1(
+            str(self.width).encode() + b':' + bytes(self.cells)).hexdigest()
+        self.moves = tuple([self._step(i, dx, dy) for i in range(self.size)]
+                           for (dx,dy) in DELTAS)
+        self.pushes = tuple([-1 if move[i] < 0 else move[move[i]] for i in range(self.size)]
+                            for move in self.moves)
+
+    def _step(self, i, dx, dy):
+        x, y = i % self.width + dx, i // self.width + dy
+        if 0 <= x < self.width and 0 <= y < self.height:
+            j = y*self.width + x
+            if not self.cells[j] & WALL:
+                return j
+        return -1
+
+    def index(self, x, y):
+        '''
+        Return the cell index of the (x,y) position
+        '''
+        return y*self.width + x
+
+    def coord(self, i):
+        '''
+        Return the (x,y) position of cell index i
+        '''
+        return (i % self.width, i // self.width)
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 class Warehouse:
     '''
@@ -61,6 +128,8 @@ class Warehouse:
     the position of the walls, targets, boxes and the worker.
     Self.boxes, self.targets and self.walls  are lists of (x,y) coordinates
     self.worker is a tuple (x,y)
+    The walls and targets are compiled into a Board when the warehouse is
+    loaded, see Warehouse.compile
     '''
     def copy(self, worker = None, boxes = None):
         '''
@@ -74,8 +143,18 @@ class Warehouse:
         result.boxes = boxes or self.boxes
         result.targets = self.targets
         result.walls = self.walls
+        result._board = getattr(self, '_board', None)
         return result
 
+    def compile(self):
+        '''
+        Return the Board of this warehouse, building it on first use.
+        Copies made with Warehouse.copy share the same Board.
+        '''
+        if getattr(self, '_board', None) is None:
+            self._board = Board(self.walls, self.targets)
+        return self._board
+
     def read_warehouse_file(self, filePath):
         '''
         Load the description of a warehouse stored in a text file
@@ -96,22 +175,37 @@ class Warehouse:
         This function sets the fields
           self.worker, self.boxes, self.targets and self.walls
         '''
-        workers =  list(find_2D_iterator(lines, "@"))  # workers on a free cell
-        workers_on_a_target = list(find_2D_iterator(lines, "!"))
+        walls, boxes, stored, targets, workers, workers_on_a_target = [], [], [], [], [], []
+        # one pass over the characters; ' ', '-' and '_' are free cells
+        for y, line in enumerate(lines):
+            for x, char in enumerate(line):
+                if char == '#':
+                    walls.append((x,y))
+                elif char == ' ' or char == '\n':
+                    continue
+                elif char == '$': # crate/box
+                    boxes.append((x,y))
+                elif char == '.': # empty target
+                    targets.append((x,y))
+                elif char == '*': # box on target
+                    stored.append((x,y))
+                elif char == '@': # worker on a free cell
+                    workers.append((x,y))
+                elif char == '!' or char == '+': # worker on a target
+                    workers_on_a_target.append((x,y))
         # Check that we have exactly one agent
         assert len(workers)+len(workers_on_a_target) == 1 
+        self.boxes = boxes + stored
+        self.targets = targets + stored
         if len(workers) == 1:
             self.worker = workers[0]
-        self.boxes = list(find_2D_iterator(lines, "$")) # crate/box
-        self.targets = list(find_2D_iterator(lines, ".")) # empty target
-        targets_with_boxes = list(find_2D_iterator(lines, "*")) # box on target
-        self.boxes += targets_with_boxes
-        self.targets += targets_with_boxes
-        if len(workers_on_a_target) == 1:
+        else:
             self.worker = workers_on_a_target[0]
             self.targets.append(self.worker) 
-        self.walls = list(find_2D_iterator(lines, "#")) # set(find_2D_iterator(lines, "#"))
+        self.walls = walls
         assert len(self.boxes) == len(self.targets)
+        self._board = None
+        self.compile()
 
 #    def visualize(self):
     def __str__(self):
@@ -149,7 +243,92 @@ class Warehouse:
 
     def __hash__(self):
         return hash(self.worker) ^ functools.reduce(operator.xor, [hash(box) for box in self.boxes])
-    
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                           COLLECTIONS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# Characters of a board row, in this module's format and in the .sok/.xsb one
+# ('+' worker on a target, '-' and '_' free cells)
+BOARD_CHARS = frozenset('#@!+$*.-_ ')
+
+def is_board_row(line):
+    '''
+    Return True if the string 'line' is a row of a board: only board
+    characters, with at least one wall.
+    '''
+    return '#' in line and BOARD_CHARS.issuperset(line)
+
+def split_levels(lines):
+    '''
+    Return a generator that yields a (title, rows) pair for each level of
+    a collection given as an iterable of lines (one level, as in the
+    warehouses directory, or many, as in .sok/.xsb files), reading them in
+    a single pass.
+    rows is the list of the board rows of the level. The other lines are
+    comments: its title is the value of a 'Title:' line after the board,
+    or else the last comment line before it (without quotes), or None.
+    ';' comment marks are dropped, and 'Key: value' lines after a board
+    are taken as its metadata.
+    '''
+    title, rows, level = None, [], None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if is_board_row(line):
+            if level is not None: # the previous level is complete
+                yield tuple(level)
+                level = None
+            rows.append(line)
+            continue
+        if rows: # end of a board
+            level, title, rows = [title, rows], None, []
+        text = line.strip().lstrip(';').strip()
+        key, colon, value = text.partition(':')
+        if level is not None and colon and len(key.split()) == 1:
+            if key.strip().lower() == 'title':
+                level[0] = value.strip()
+        elif text:
+            title = text.strip('\'"')
+    if rows:
+        level = [title, rows]
+    if level is not None:
+        yield tuple(level)
+
+def read_lines(path, use_mmap=False):
+    '''
+    Return a generator that yields the lines of the text file 'path', read
+    lazily from the file, or from a memory map of it if use_mmap is True.
+    '''
+    if not use_mmap:
+        with open(path, 'r') as f:
+            for line in f:
+                yield line
+        return
+    import mmap
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(mapped.readline, b''):
+                yield line.decode('utf-8', 'replace')
+        finally:
+            mapped.close()
+
+def read_collection(path, use_mmap=False):
+    '''
+    Return a generator that yields a Warehouse for each level of the
+    collection file 'path', compiled and with its title in
+    warehouse.title, without reading the whole file in memory.
+    See split_levels and read_lines.
+    '''
+    for title, rows in split_levels(read_lines(path, use_mmap)):
+        warehouse = Warehouse()
+        warehouse.extract_locations(rows)
+        warehouse.title = title
+        yield warehouse
+
 if __name__ == "__main__":
     wh = Warehouse()
     wh.read_warehouse_file("./warehouses/warehouse_03.txt")
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+'''
+Regression tests of puzzler.taboo_cells on the levels where the linear
+pass of gen_taboos changed the taboo cells of the earlier version.
+
+	python3 -m pytest -q test_taboo.py
+'''
+
+import os
+import unittest
+
+import puzzler
+import sokoban
+
+WAREHOUSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouses')
+
+def taboo(name):
+	#the (x, y) cells marked 'X' by taboo_cells for warehouses/name
+	warehouse = sokoban.Warehouse()
+	warehouse.read_warehouse_file(os.path.join(WAREHOUSES, name))
+	rows = puzzler.taboo_cells(warehouse).split('\n')
+	return set((x, y) for y, row in enumerate(rows) for x, cell in enumerate(row) if cell == 'X')
+
+class TabooCellsTest(unittest.TestCase):
+
+	def test_171_wall_run_between_corners(self):
+		#(2,6) and (2,8) are corners along the wall x=1, with no target
+		#between them: rule 2 makes (2,7) taboo too
+		cells = taboo('warehouse_171.txt')
+		self.assertTrue(set([(2, 6), (2, 7), (2, 8)]) <= cells)
+
+	def test_177_runs_without_a_wall_along_them(self):
+		#the run of row 9 from corner (3,9) to corner (9,9) has openings at
+		#(8,8) above and (9,10) below, and the run of column 9 from (9,9)
+		#to (9,11) has openings at (8,9) and (10,11): neither is rule 2
+		cells = taboo('warehouse_177.txt')
+		self.assertTrue(set([(3, 9), (9, 9), (9, 11)]) <= cells)
+		self.assertFalse(set((x, 9) for x in range(4, 9)) & cells)
+		self.assertNotIn((9, 10), cells)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+'''
+Check solutions of warehouses quickly, one at a time or by whole files.
+
+A solution is replayed in place on the compiled board of its warehouse: a
+bytearray of the box cells and the worker cell are updated move by move,
+so a solution of n moves is checked in O(n) without building states.
+Solutions are lists of action names, or strings in LURD notation (upper
+case for pushes, as written by batch.py; the case is not checked).
+
+	python3 verify.py summary.jsonl
+'''
+
+import argparse
+import itertools
+import json
+import sys
+from collections import namedtuple
+
+import sokoban
+
+#the result of replay
+#  legal: True if every move could be made
+#  failed_at: index of the first illegal move, or None
+#  moves, pushes: number of moves and pushes made before stopping
+#  solved: True if every box ends on a target
+#  worker, boxes: the final cells of the worker and the boxes
+Replay = namedtuple('Replay', 'legal failed_at moves pushes solved worker boxes')
+
+#LURD letters and action names of each direction of sokoban.ACTIONS
+_DIRECTIONS = {}
+for d, action in enumerate(sokoban.ACTIONS):
+	for name in (action, action[0], action[0].lower()):
+		_DIRECTIONS[name] = d
+
+def replay(warehouse, moves):
+	'''
+	Replay the moves (a LURD string or a list of action names) on the
+	warehouse, stopping at the first illegal one: a step into a wall, a
+	push of a box into a wall or another box, or an unknown action.
+	The warehouse is not changed.
+
+	@return
+	    a Replay
+	'''
+	board = warehouse.compile()
+	cells, step = board.cells, board.moves
+	worker = board.index(*warehouse.worker)
+	boxes = bytearray(board.size)
+	off_target = 0
+	for (x,y) in warehouse.boxes:
+		boxes[board.index(x,y)] = 1
+		off_target += not cells[board.index(x,y)] & sokoban.TARGET
+	pushes = 0
+	failed_at = None
+
+	for n, action in enumerate(moves):
+		d = _DIRECTIONS.get(action)
+		if d is None:
+			failed_at = n
+			break
+		move = step[d]
+		position = move[worker]
+		if position < 0:
+			failed_at = n
+			break
+		if boxes[position]:
+			check = move[position]
+			if check < 0 or boxes[check]:
+				failed_at = n
+				break
+			boxes[position], boxes[check] = 0, 1
+			off_target += (cells[position] & sokoban.TARGET != 0) - (cells[check] & sokoban.TARGET != 0)
+			pushes += 1
+		worker = position
+
+	done = len(moves) if failed_at is None else failed_at
+	return Replay(failed_at is None, failed_at, done, pushes, off_target == 0,
+		worker, [i for i, box in enumerate(boxes) if box])
+
+_levels = {} #path, levels read and reader of the last collection of load_warehouse
+
+def load_warehouse(name):
+	'''
+	Load the warehouse of a file, or the level n of a collection file if
+	name is 'path#n' (see batch.warehouse_jobs). The levels of the last
+	collection are kept, so its levels are read once for many solutions.
+	'''
+	levels = _levels
+	path, sharp, n = name.rpartition('#')
+	if not sharp or not n.isdigit():
+		warehouse = sokoban.Warehouse()
+		warehouse.read_warehouse_file(name)
+		return warehouse
+	if levels.get('path') != path:
+		levels.clear()
+		levels['path'] = path
+		levels['levels'] = []
+		levels['reader'] = sokoban.read_collection(path, use_mmap=True)
+	loaded = levels['levels']
+	loaded += itertools.islice(levels['reader'], max(0, int(n) - len(loaded)))
+	if not 1 <= int(n) <= len(loaded):
+		raise ValueError('{0} has no level {1}'.format(path, n))
+	return loaded[int(n) - 1]
+
+def verify_solutions(lines):
+	'''
+	Check the solutions listed in 'lines', yielding a dict per solution
+	with its warehouse file and the fields of its Replay (but the final
+	position). A line is a JSON object with 'file' and 'solution' (the
+	output of batch.py; results without a solution are skipped), or a
+	warehouse file and a LURD string separated by white space.
+	'''
+	for line in lines:
+		line = line.strip()
+		if not line:
+			continue
+		if line.startswith('{'):
+			entry = json.loads(line)
+			name, solution = entry.get('file'), entry.get('solution')
+			if solution is None:
+				continue
+		else:
+			name, _, solution = line.partition(' ')
+			solution = solution.strip()
+		result = dict(file=name)
+		try:
+			checked = replay(load_warehouse(name), solution)
+			result.update((field, getattr(checked, field))
+				for field in ('legal', 'failed_at', 'moves', 'pushes', 'solved'))
+		except (IOError, ValueError, AssertionError) as error:
+			result.update(legal=False, error='{0}: {1}'.format(type(error).__name__, error))
+		yield result
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+	parser.add_argument('files', nargs='+', help='solution files (JSON lines of batch.py, or "warehouse LURD" lines)')
+	args = parser.parse_args(argv)
+
+	failures = 0
+	for path in args.files:
+		with open(path) as f:
+			for result in verify_solutions(f):
+				failures += not (result['legal'] and result.get('solved'))
+				print(json.dumps(result), flush=True)
+	return 1 if failures else 0
+
+if __name__ == '__main__':
+	sys.exit(main())